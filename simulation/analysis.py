@@ -0,0 +1,106 @@
+import math
+import numpy as np
+from wound import wound_mask, wound_area
+
+class OccupancyGrid():
+	# cell counts per square bin of the box; each cell remembers the bin it was counted in
+	# (engine.bin) and the engine marks the rows it moves, adds or deactivates, so an update
+	# rebins only the rows marked since the last one
+	def __init__(self, bounds, size=8.0):
+		self.size = size
+		self.nx = int(math.ceil(bounds / size))
+		self.counts = np.zeros(self.nx * self.nx, dtype=np.int64)
+		self.pending = list()
+
+	def bin_of(self, pos):
+		b = np.clip((pos // self.size).astype(np.intp), 0, self.nx - 1)
+		return b[:, 1] * self.nx + b[:, 0]
+
+	def centers(self):
+		k = np.arange(self.nx * self.nx)
+		return (np.stack((k % self.nx, k // self.nx), axis=1) + 0.5) * self.size
+
+	def mark(self, rows):
+		self.pending.append(rows)
+
+	def count(self, engine):
+		# every cell from scratch, once when the grid is attached
+		engine.bin[:] = np.where(engine.active, self.bin_of(engine.pos), -1)
+		self.counts = np.bincount(engine.bin[engine.bin >= 0], minlength=self.nx * self.nx)
+		self.pending = list()
+
+	def drop(self, bins):
+		bins = bins[bins >= 0]
+		self.counts -= np.bincount(bins, minlength=len(self.counts))
+
+	def update(self, engine):
+		if not self.pending:
+			return 0
+		rows = np.concatenate(self.pending)
+		self.pending = list()
+		# a row marked more than once is rebinned once; past a fraction of the population a mask
+		# over the rows is cheaper than sorting them
+		if len(rows) > len(engine) // 8:
+			mask = np.zeros(len(engine), dtype=bool)
+			mask[rows] = True
+			rows = np.flatnonzero(mask)
+		else:
+			rows = np.unique(rows)
+		new = np.where(engine.active[rows], self.bin_of(engine.pos[rows]), -1)
+		changed = new != engine.bin[rows]
+		rows, old, new = rows[changed], engine.bin[rows[changed]], new[changed]
+		self.counts -= np.bincount(old[old >= 0], minlength=len(self.counts))
+		self.counts += np.bincount(new[new >= 0], minlength=len(self.counts))
+		engine.bin[rows] = new
+		return len(rows)
+
+class WoundAnalysis():
+	# closure metrics read off the occupancy grid, the cost per sample depends on the number of
+	# wound bins and of cells moved since the last sample, not on the population size
+	def __init__(self, engine, geometry, area, angles=3, center=None, size=8.0, sectors=32):
+		bounds = engine.bounds
+		if center is None:
+			center = (bounds / 2, bounds / 2)
+		self.grid = OccupancyGrid(bounds, size)
+		engine.occupancy = self.grid
+		self.grid.count(engine)
+		self.geometry = geometry
+		self.area = wound_area(geometry, area, angles, bounds)
+		centers = self.grid.centers()
+		self.wound = np.flatnonzero(wound_mask(centers, geometry, area, angles, center, bounds))
+
+		# the gap is profiled per column for a line wound and per angular sector otherwise, the
+		# front of a profile is its open bin furthest from the wound's middle
+		d = centers[self.wound] - np.array(center)
+		if geometry == "line":
+			self.profile = (centers[self.wound, 0] // size).astype(np.intp)
+			self.distance = np.abs(d[:, 1])
+		else:
+			angle = np.arctan2(d[:, 1], d[:, 0])
+			self.profile = ((angle + math.pi) / (2 * math.pi) * sectors).astype(np.intp) % sectors
+			self.distance = np.hypot(d[:, 0], d[:, 1])
+		self.profiles = int(self.profile.max()) + 1 if len(self.wound) else 0
+		self.last = None
+
+	def sample(self, engine):
+		self.grid.update(engine)
+		counts = self.grid.counts[self.wound]
+		open_ = counts == 0
+		coverage = 1.0 - np.count_nonzero(open_) / max(len(self.wound), 1)
+
+		front = np.zeros(self.profiles)
+		np.maximum.at(front, self.profile[open_], self.distance[open_])
+
+		rate = 0.0
+		if self.last is not None and engine.steps > self.last["step"]:
+			rate = (coverage - self.last["coverage"]) / (engine.steps - self.last["step"])
+		self.last = {
+			"step": engine.steps,
+			"coverage": float(coverage),
+			"closure_rate": float(rate),
+			"closed_area_rate": float(rate * self.area),
+			"leading_edge": float(front.mean()) if self.profiles else 0.0,
+			"roughness": float(front.std()) if self.profiles else 0.0,
+			"wound_cells": int(counts.sum()),
+		}
+		return self.last
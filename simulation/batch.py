@@ -0,0 +1,285 @@
+import argparse
+import itertools
+import json
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from engine import CellEngine, BOUNDS, BOUNDARIES, MODEL_VERSION
+from decomposition import TiledEngine
+from wound import GEOMETRIES, wound_mask, wound_area, engine_area
+from trajectory import TrajectoryWriter, replace_file
+from analysis import WoundAnalysis
+from seeding import SEEDINGS
+from cache import ResultCache, run_key, discard
+from checkpoint import save as save_checkpoint, load as load_checkpoint, header as checkpoint_header
+from ensemble import EnsembleEngine
+
+def make_runs(r1s, r2s, r3s, geometries, areas, angles, cells, seeds, steps, entropy=0,
+		bounds=BOUNDS, density=None, boundary="reflective", seeding="random"):
+	# full grid of parameter combinations, angles only vary polygon wounds; with a density the
+	# box grows with the cell count instead of staying at bounds
+	runs = list()
+	seen = set()
+	for r1, r2, r3, geo, area, ang, n, seed in itertools.product(r1s, r2s, r3s, geometries, areas, angles, cells, seeds):
+		if geo != "poly":
+			ang = None
+		key = (r1, r2, r3, geo, area, ang, n, seed)
+		if key in seen:
+			continue
+		seen.add(key)
+		runs.append({"r1": r1, "r2": r2, "r3": r3, "geometry": geo, "area": area, "angles": ang,
+			"cells": n, "seed": seed, "entropy": entropy, "steps": steps,
+			"bounds": math.sqrt(n / density) if density else bounds, "boundary": boundary, "seeding": seeding})
+	return runs
+
+def run_stream(params):
+	# a run's seed picks its child of one root sequence, the same stream root.spawn() would hand
+	# out, so streams are independent and do not depend on which worker process runs them
+	return np.random.SeedSequence(params["entropy"], spawn_key=(params["seed"],))
+
+def wound_size(params):
+	# --area is in the dialog's scene units, the same flags cut the same wound as the dialog does
+	return engine_area(params["geometry"], params["area"], params["bounds"])
+
+def summarize(engine, params, removed, elapsed):
+	alive = engine.active
+	side = params["bounds"]
+	center = (side / 2, side / 2)
+	area = wound_size(params)
+	inside = wound_mask(engine.pos[alive], params["geometry"], area, params["angles"] or 3, center, side)
+	density = params["cells"] / (side * side)
+	expected = density * wound_area(params["geometry"], area, params["angles"] or 3, side)
+	speed = np.linalg.norm(engine.vel[alive], axis=1)
+	return {
+		"steps": engine.steps,
+		"cells_initial": params["cells"],
+		"cells_removed": removed,
+		"cells_final": int(np.count_nonzero(alive)),
+		"motile_fraction": float(engine.motile[alive].mean()) if alive.any() else 0.0,
+		"mean_speed": float(speed.mean()) if len(speed) else 0.0,
+		"wound_cells": int(np.count_nonzero(inside)),
+		"wound_coverage": float(np.count_nonzero(inside) / expected) if expected > 0 else 0.0,
+		"elapsed": elapsed,
+	}
+
+def make_engine(params, tiles=None):
+	if tiles:
+		return TiledEngine(seed=run_stream(params), bounds=params["bounds"], boundary=params["boundary"], workers=tiles)
+	return CellEngine(seed=run_stream(params), bounds=params["bounds"], boundary=params["boundary"])
+
+def resume_series(path, step):
+	# drop the samples a resumed run is about to take again, into a new file the run appends to
+	with open(path) as f:
+		kept = [line for line in f if json.loads(line)["step"] <= step]
+	replace_file(path, lambda f: f.write("".join(kept).encode()))
+
+def run(params, record=None, record_every=1, profile=None, tiles=None, analysis=None, analyze_every=10,
+		checkpoint=None, checkpoint_every=None, key=None):
+	# one headless simulation, mirroring MenuController's setup without a display; with a
+	# checkpoint path the run picks up from that file when it exists and saves to it as it goes,
+	# key (run_key of the run) goes into every checkpoint so a resume can tell whose it is
+	start = time.time()
+	engine = make_engine(params, tiles)
+	engine.profiler.enable(profile is not None)
+	engine.set_coeffs(params["r1"], params["r2"], params["r3"])
+	side = params["bounds"]
+	center = (side / 2, side / 2)
+	resumed = None
+	if checkpoint and os.path.exists(checkpoint):
+		engine, meta = load_checkpoint(checkpoint, engine)
+		resumed = engine.steps
+		removed = meta["extra"]["removed"]
+	else:
+		engine.seed_cells(params["cells"], params["seeding"])
+		hit = wound_mask(engine.pos, params["geometry"], wound_size(params), params["angles"] or 3, center, side)
+		engine.remove(hit)
+		removed = int(np.count_nonzero(hit))
+
+	writer = TrajectoryWriter(record, resume_step=resumed, bounds=side, boundary=params["boundary"]) if record else None
+	# closure metrics go out one JSON line per sample as the run goes
+	closure = None
+	if analysis:
+		closure = WoundAnalysis(engine, params["geometry"], wound_size(params), params["angles"] or 3, center)
+		if resumed is not None and os.path.exists(analysis):
+			resume_series(analysis, resumed)
+			closure.last = meta["extra"]["closure"]
+		elif os.path.exists(analysis):
+			os.remove(analysis)
+		stream = open(analysis, "a")
+	while engine.steps < params["steps"]:
+		if engine.num_active() < len(engine):
+			engine.compact()
+		engine.divide()
+		engine.step()
+		if writer and engine.steps % record_every == 0:
+			writer.append(engine)
+		if closure and engine.steps % analyze_every == 0:
+			stream.write(json.dumps(closure.sample(engine)) + "\n")
+			stream.flush()
+		if checkpoint_every and engine.steps % checkpoint_every == 0:
+			# the trajectory index has to reach this step before the checkpoint claims it
+			if writer:
+				writer.flush()
+			save_checkpoint(engine, checkpoint, extra={"removed": removed, "closure": closure.last if closure else None, "key": key})
+	if writer:
+		writer.close()
+	if closure:
+		stream.close()
+	if profile:
+		engine.profiler.to_csv(profile)
+	if tiles:
+		engine.close()
+
+	metrics = summarize(engine, params, removed, time.time() - start)
+	if closure and closure.last:
+		metrics["closure"] = closure.last
+	return metrics
+
+def run_to_file(index, params, out, record=False, record_every=1, profile=False, tiles=None, analyze_every=None, cache=None,
+		checkpoint_every=None):
+	traj = os.path.join(out, "run_{0:05d}.traj".format(index)) if record else None
+	ckpt = os.path.join(out, "run_{0:05d}.ckpt.npz".format(index)) if checkpoint_every else None
+	csv = os.path.join(out, "run_{0:05d}.profile.csv".format(index)) if profile else None
+	series = os.path.join(out, "run_{0:05d}.closure.jsonl".format(index)) if analyze_every else None
+	path = os.path.join(out, "run_{0:05d}.json".format(index))
+	# the run's identity, for the cache and for telling its checkpoints from another run's
+	# a tiled run sums its forces in another order, so its results are its own
+	key = run_key(params, {"record_every": record_every if record else None, "analyze_every": analyze_every,
+		"tiled": bool(tiles)})
+	# timings are what a profiled run is for, so those always run
+	cached = cache and not profile
+	if cached:
+		metrics = cache.get(key)
+		if metrics is not None:
+			if traj:
+				cache.fetch(key, "run.traj", traj)
+			if series:
+				cache.fetch(key, "closure.jsonl", series)
+			with open(path, "w") as f:
+				json.dump({"params": params, "metrics": metrics, "cache": key}, f, indent=1)
+			return path
+
+	# a checkpoint left by another run or another model version is not resumed, the run starts over
+	if ckpt and os.path.exists(ckpt):
+		meta = checkpoint_header(ckpt)
+		if meta.get("model") != MODEL_VERSION or (meta.get("extra") or {}).get("key") != key:
+			discard(ckpt)
+	# outputs of an earlier run may be hard links into the cache, a fresh run starts without them
+	if not (ckpt and os.path.exists(ckpt)):
+		for stale in (traj, series):
+			if stale:
+				discard(stale)
+	metrics = run(params, traj, record_every, csv, tiles, series, analyze_every, ckpt, checkpoint_every, key)
+	if cached:
+		files = dict()
+		if traj:
+			files["run.traj"] = traj
+		if series:
+			files["closure.jsonl"] = series
+		cache.put(key, metrics, files)
+	with open(path, "w") as f:
+		json.dump({"params": params, "metrics": metrics}, f, indent=1)
+	return path
+
+def ensemble_groups(runs, size):
+	# indices of the runs that can share an ensemble: everything but the seed and the rule
+	# coefficients equal, at most size runs each
+	groups = dict()
+	for i, p in enumerate(runs):
+		key = json.dumps(dict((k, v) for k, v in p.items() if k not in ("seed", "r1", "r2", "r3")), sort_keys=True)
+		groups.setdefault(key, list()).append(i)
+	return [g[k:k + size] for g in groups.values() for k in range(0, len(g), size)]
+
+def run_ensemble(indices, runs, out):
+	# the runs of one group stepped together; each replica starts from the layout its single run
+	# would, the dynamics draw from one stream spawned off the first run's
+	start = time.time()
+	group = [runs[i] for i in indices]
+	first = group[0]
+	engine = EnsembleEngine(len(group), [p["r1"] for p in group], [p["r2"] for p in group], [p["r3"] for p in group],
+		seed=run_stream(first).spawn(1)[0], bounds=first["bounds"], boundary=first["boundary"])
+	engine.seed_cells(first["cells"], first["seeding"], [run_stream(p) for p in group])
+	removed = engine.cut_wound(first["geometry"], wound_size(first), first["angles"] or 3)
+	while engine.steps < first["steps"]:
+		if engine.num_active() < len(engine):
+			engine.compact()
+		engine.divide()
+		engine.step()
+	# elapsed is the ensemble's time shared out over its runs
+	elapsed = (time.time() - start) / len(group)
+	paths = list()
+	for k, (i, params) in enumerate(zip(indices, group)):
+		metrics = summarize(engine.member(k), params, int(removed[k]), elapsed)
+		path = os.path.join(out, "run_{0:05d}.json".format(i))
+		with open(path, "w") as f:
+			json.dump({"params": params, "metrics": metrics, "ensemble": len(group)}, f, indent=1)
+		paths.append(path)
+	return paths
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Run wound simulations headless over a parameter grid.")
+	parser.add_argument("--r1", type=float, nargs="+", default=[0.01], help="rule 1 coefficients")
+	parser.add_argument("--r2", type=float, nargs="+", default=[0.01], help="rule 2 coefficients")
+	parser.add_argument("--r3", type=float, nargs="+", default=[0.01], help="rule 3 coefficients")
+	parser.add_argument("--geometry", nargs="+", default=["line"], choices=GEOMETRIES, help="wound geometries")
+	parser.add_argument("--area", type=float, nargs="+", default=[100.0], help="wound sizes in the dialog's scene units: a line's width, a polygon's or circle's area")
+	parser.add_argument("--angles", type=int, nargs="+", default=[3], help="polygon wound corners")
+	parser.add_argument("--cells", type=int, nargs="+", default=[2500], help="initial cell counts")
+	parser.add_argument("--seeds", type=int, nargs="+", default=[0], help="random streams, spawned from --entropy")
+	parser.add_argument("--entropy", type=int, default=0, help="root seed of the sweep")
+	parser.add_argument("--steps", type=int, default=1000, help="steps per run")
+	parser.add_argument("--bounds", type=float, default=BOUNDS, help="side of the square box")
+	parser.add_argument("--density", type=float, help="cells per unit area, sizes the box per cell count instead of --bounds")
+	parser.add_argument("--boundary", default="reflective", choices=BOUNDARIES, help="what the box edges do")
+	parser.add_argument("--seeding", default="random", choices=SEEDINGS, help="initial cell layout")
+	parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+	parser.add_argument("--out", default="runs", help="output directory")
+	parser.add_argument("--record", action="store_true", help="also record each run's trajectory")
+	parser.add_argument("--record-every", type=int, default=1, help="steps between recorded frames")
+	parser.add_argument("--profile", action="store_true", help="also write per-step phase timings as CSV")
+	parser.add_argument("--analyze-every", type=int, help="steps between wound closure samples")
+	parser.add_argument("--tiles", type=int, help="step each run on this many processes, one strip of the box each")
+	parser.add_argument("--checkpoint-every", type=int, help="steps between checkpoints, an interrupted sweep rerun into the same --out resumes from them")
+	parser.add_argument("--cache", help="result cache directory, runs already in it are not recomputed")
+	parser.add_argument("--cache-size", type=float, default=1024, help="cache size limit in MB")
+	parser.add_argument("--ensemble", type=int, help="step up to this many runs differing only in seed and r1/r2/r3 as one population")
+	args = parser.parse_args(argv)
+	if args.ensemble:
+		for name in ("record", "profile", "analyze_every", "tiles", "checkpoint_every", "cache"):
+			if getattr(args, name):
+				parser.error("--ensemble does not support --{0}".format(name.replace("_", "-")))
+	return args
+
+def main(argv=None):
+	args = parse_args(argv)
+	os.makedirs(args.out, exist_ok=True)
+	runs = make_runs(args.r1, args.r2, args.r3, args.geometry, args.area, args.angles, args.cells, args.seeds, args.steps, args.entropy,
+		args.bounds, args.density, args.boundary, args.seeding)
+	cache = ResultCache(args.cache, int(args.cache_size * (1 << 20))) if args.cache else None
+	if args.tiles:
+		# a tiled run already uses the cores, so the sweep goes one run at a time
+		print("{0} runs on {1} tiles each\n".format(len(runs), args.tiles))
+		for i, p in enumerate(runs):
+			print("{0}/{1} {2}".format(i + 1, len(runs), run_to_file(i, p, args.out, args.record, args.record_every, args.profile, args.tiles, args.analyze_every, cache, args.checkpoint_every)))
+		return
+	if args.ensemble:
+		groups = ensemble_groups(runs, args.ensemble)
+		print("{0} runs in {1} ensembles on {2} workers\n".format(len(runs), len(groups), args.workers))
+		with ProcessPoolExecutor(max_workers=args.workers) as pool:
+			futures = [pool.submit(run_ensemble, g, runs, args.out) for g in groups]
+			done = 0
+			for future in as_completed(futures):
+				for path in future.result():
+					done += 1
+					print("{0}/{1} {2}".format(done, len(runs), path))
+		return
+	print("{0} runs on {1} workers\n".format(len(runs), args.workers))
+	with ProcessPoolExecutor(max_workers=args.workers) as pool:
+		futures = [pool.submit(run_to_file, i, p, args.out, args.record, args.record_every, args.profile, None, args.analyze_every, cache, args.checkpoint_every) for i, p in enumerate(runs)]
+		for k, future in enumerate(as_completed(futures)):
+			print("{0}/{1} {2}".format(k + 1, len(runs), future.result()))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,169 @@
+import argparse
+import json
+import os
+import platform
+import subprocess
+import time
+import numpy as np
+from engine import CellEngine, row_nbytes
+from wound import wound_mask, SCENE_SIZE
+
+SIZES = (1000, 10000, 100000, 1000000)
+CASES = ("step", "neighbor", "division", "wound", "render", "heatmap")
+
+# cells per unit area of the dialog's 2500 starting cells in the 256 box, kept at every size
+# so neighbor counts per cell stay the same and only the population grows
+DENSITY = 2500 / 256.0 ** 2
+
+def populate(n, seed, density=DENSITY):
+	side = float(np.sqrt(n / density))
+	engine = CellEngine(seed=seed, bounds=side)
+	engine.add_cells(engine.rng.random((n, 2)) * side)
+	# a few steps so motility and velocities are past their initial values
+	for _ in range(3):
+		engine.step()
+	return engine
+
+def timed(fn, repeat, setup=None):
+	times = list()
+	for _ in range(repeat):
+		if setup:
+			setup()
+		start = time.perf_counter()
+		fn()
+		times.append(time.perf_counter() - start)
+	return times
+
+def reset(engine, base, seed):
+	# the same cells and the same random stream before every timed repeat
+	engine.load(base)
+	engine.rng = np.random.default_rng(seed)
+
+def bench_step(engine, base, repeat, seed):
+	# one SceneState.step worth of work: divide then the engine step
+	def step():
+		engine.divide()
+		engine.step()
+	return timed(step, repeat, lambda: reset(engine, base, seed)), {}
+
+def bench_neighbor(engine, base, repeat, seed):
+	idx = np.arange(len(base))
+	found = dict()
+	def query():
+		found["pairs"] = len(engine.neighbor_pairs(idx)[0])
+	return timed(query, repeat, lambda: reset(engine, base, seed)), found
+
+def bench_division(engine, base, repeat, seed):
+	# a tenth of the population reaches full size in the same step
+	def setup():
+		reset(engine, base, seed)
+		engine.radius[engine.rng.random(len(engine)) < 0.1] = 12
+	found = dict()
+	def burst():
+		found["divisions"] = len(engine.divide())
+	return timed(burst, repeat, setup), found
+
+def bench_wound(engine, base, repeat, seed):
+	# circular wound over a tenth of the box, cut and compacted away
+	side = engine.bounds
+	found = dict()
+	def cut():
+		hit = wound_mask(engine.pos, "circle", 0.1 * side * side, 3, (side / 2, side / 2), side)
+		engine.remove(hit)
+		found["removed"] = int(np.count_nonzero(hit))
+	return timed(cut, repeat, lambda: reset(engine, base, seed)), found
+
+def bench_render(engine, base, repeat, seed, detail="cells"):
+	# the batched renderer painting the whole population into a dialog sized offscreen image
+	os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+	from PyQt5.QtGui import QImage, QPainter
+	from PyQt5.QtWidgets import QApplication
+	from renderer import PopulationGraphicsItem, SCENE_RECT
+	app = QApplication.instance() or QApplication(["benchmark"])
+
+	view = CellEngine()
+	view.load(base)
+	item = PopulationGraphicsItem(view, SCENE_RECT, SCENE_SIZE / engine.bounds)
+	item.detail = detail
+	image = QImage(int(SCENE_RECT.width()), int(SCENE_RECT.height()), QImage.Format_ARGB32)
+	def paint():
+		painter = QPainter(image)
+		item.paint(painter, None, None)
+		painter.end()
+	return timed(paint, repeat, lambda: image.fill(0)), {}
+
+def bench_heatmap(engine, base, repeat, seed):
+	return bench_render(engine, base, repeat, seed, "heatmap")
+
+BENCHES = {
+	"step": bench_step,
+	"neighbor": bench_neighbor,
+	"division": bench_division,
+	"wound": bench_wound,
+	"render": bench_render,
+	"heatmap": bench_heatmap,
+}
+
+def commit():
+	try:
+		out = subprocess.run(["git", "rev-parse", "HEAD"], stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+			cwd=os.path.dirname(os.path.abspath(__file__)))
+		return out.stdout.decode().strip() or None
+	except OSError:
+		return None
+
+def machine():
+	return {
+		"commit": commit(),
+		"python": platform.python_version(),
+		"numpy": np.__version__,
+		"platform": platform.platform(),
+		"processor": platform.processor(),
+		"cpus": os.cpu_count(),
+		"date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+	}
+
+def run(sizes, cases, repeat, seed):
+	results = list()
+	for n in sizes:
+		engine = populate(n, seed)
+		base = engine.snapshot()
+		for case in cases:
+			times, extra = BENCHES[case](engine, base, repeat, seed)
+			result = {"case": case, "cells": n, "repeat": repeat, "times": times,
+				"min": min(times), "median": float(np.median(times)), "mean": float(np.mean(times))}
+			result.update(extra)
+			results.append(result)
+			print("{0:>9} {1:>8} cells  median {2:9.2f} ms  min {3:9.2f} ms".format(case, n, 1000 * result["median"], 1000 * result["min"]))
+	return results
+
+def compare(old, new):
+	# median ratio new/old for every case and size present in both files
+	before = dict(((r["case"], r["cells"]), r["median"]) for r in old["results"])
+	for r in new["results"]:
+		key = (r["case"], r["cells"])
+		if key in before:
+			print("{0:>9} {1:>8} cells  {2:6.2f}x".format(r["case"], r["cells"], r["median"] / before[key]))
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Time the step, neighbor, division, wound, render and heatmap paths.")
+	parser.add_argument("--sizes", type=int, nargs="+", default=list(SIZES), help="cell counts")
+	parser.add_argument("--cases", nargs="+", default=list(CASES), choices=CASES, help="benchmarks to run")
+	parser.add_argument("--repeat", type=int, default=5, help="timed repetitions per case")
+	parser.add_argument("--seed", type=int, default=0, help="seed of every population")
+	parser.add_argument("--out", default="benchmark.json", help="JSON results file")
+	parser.add_argument("--compare", help="earlier results file to compare against")
+	return parser.parse_args(argv)
+
+def main(argv=None):
+	args = parse_args(argv)
+	report = {"machine": machine(), "seed": args.seed, "density": DENSITY, "cell_bytes": row_nbytes(),
+		"results": run(args.sizes, args.cases, args.repeat, args.seed)}
+	with open(args.out, "w") as f:
+		json.dump(report, f, indent=1)
+	if args.compare:
+		with open(args.compare) as f:
+			compare(json.load(f), report)
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,121 @@
+import hashlib
+import json
+import os
+import shutil
+import uuid
+from engine import MODEL_VERSION
+
+def run_key(params, outputs=None):
+	# sha256 of the full parameter set, the outputs asked for and the model version
+	blob = json.dumps({"params": params, "outputs": outputs, "model": MODEL_VERSION}, sort_keys=True)
+	return hashlib.sha256(blob.encode()).hexdigest()
+
+def link_or_copy(src, dst):
+	# entries and run outputs share their files when they are on one filesystem
+	try:
+		os.link(src, dst)
+	except OSError:
+		shutil.copy2(src, dst)
+
+def discard(path):
+	# unlink rather than overwrite, a file hard linked into the cache must never be truncated
+	if os.path.isdir(path):
+		shutil.rmtree(path)
+	elif os.path.exists(path):
+		os.remove(path)
+
+def place(src, dst):
+	discard(dst)
+	if os.path.isdir(src):
+		shutil.copytree(src, dst, copy_function=link_or_copy)
+	else:
+		link_or_copy(src, dst)
+
+def file_size(path):
+	# space actually used, trajectory chunks are allocated sparse at their full row count
+	st = os.stat(path)
+	if hasattr(st, "st_blocks"):
+		return min(st.st_size, 512 * st.st_blocks)
+	return st.st_size
+
+def disk_size(path):
+	if not os.path.isdir(path):
+		return file_size(path)
+	return sum(file_size(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+class ResultCache():
+	# content addressed store of finished runs: one directory per key holding the run's metrics
+	# (result.json) and whatever output files it kept. An entry's result.json mtime is its last
+	# use, the least recently used entries go once the store grows past max_bytes.
+	def __init__(self, root, max_bytes=1 << 30):
+		self.root = root
+		self.max_bytes = max_bytes
+		os.makedirs(root, exist_ok=True)
+
+	def entry(self, key):
+		return os.path.join(self.root, key[:2], key)
+
+	def get(self, key):
+		# the cached result dict, or None; a hit counts as a use
+		result = os.path.join(self.entry(key), "result.json")
+		try:
+			with open(result) as f:
+				found = json.load(f)
+			os.utime(result)
+		except (OSError, ValueError):
+			return None
+		return found
+
+	def fetch(self, key, name, dst):
+		# copy (or hard link) one stored output file or directory out of an entry
+		place(os.path.join(self.entry(key), name), dst)
+
+	def put(self, key, result, files=None):
+		# files maps stored names to paths; the entry is built aside and renamed into place, so
+		# concurrent writers of the same key leave one complete entry
+		entry = self.entry(key)
+		if os.path.exists(entry):
+			return
+		tmp = os.path.join(self.root, "tmp_" + uuid.uuid4().hex)
+		os.makedirs(tmp)
+		for name, path in (files or {}).items():
+			place(path, os.path.join(tmp, name))
+		with open(os.path.join(tmp, "result.json"), "w") as f:
+			json.dump(result, f, indent=1)
+		os.makedirs(os.path.dirname(entry), exist_ok=True)
+		try:
+			os.rename(tmp, entry)
+		except OSError:
+			shutil.rmtree(tmp, ignore_errors=True)
+		self.evict()
+
+	def entries(self):
+		# (last use, bytes, path) of every complete entry
+		found = list()
+		for prefix in os.listdir(self.root):
+			group = os.path.join(self.root, prefix)
+			if prefix.startswith("tmp_") or not os.path.isdir(group):
+				continue
+			for key in os.listdir(group):
+				entry = os.path.join(group, key)
+				try:
+					found.append((os.path.getmtime(os.path.join(entry, "result.json")), disk_size(entry), entry))
+				except OSError:
+					pass
+		return found
+
+	def size(self):
+		return sum(size for _, size, _ in self.entries())
+
+	def evict(self):
+		entries = sorted(self.entries())
+		total = sum(size for _, size, _ in entries)
+		for _, size, entry in entries:
+			if total <= self.max_bytes:
+				break
+			shutil.rmtree(entry, ignore_errors=True)
+			total -= size
+
+	def clear(self):
+		for _, _, entry in self.entries():
+			shutil.rmtree(entry, ignore_errors=True)
@@ -0,0 +1,47 @@
+import json
+import os
+import numpy as np
+from engine import CellEngine, STATE, MODEL_VERSION
+
+# engine scalars a resumed run needs besides the per-cell arrays
+PARAMETERS = ("r1coeff", "r2coeff", "r3coeff", "div_coeff", "speed", "interaction_radius",
+	"motility_switch_nonmotile", "bounds", "boundary", "steps", "next_id")
+
+def save(engine, path, wound=None, extra=None):
+	# one uncompressed npz: every per-cell array plus a JSON header with the engine's parameters,
+	# its random stream and whatever wound and extra state the caller keeps. Written aside and
+	# renamed, so a run killed mid-write leaves the previous checkpoint intact.
+	meta = {"model": MODEL_VERSION, "rng": engine.rng.bit_generator.state, "wound": wound, "extra": extra}
+	for name in PARAMETERS:
+		meta[name] = getattr(engine, name)
+	arrays = dict((name, getattr(engine, name)) for name in STATE)
+	arrays["meta"] = np.array(json.dumps(meta))
+	tmp = path + ".tmp"
+	with open(tmp, "wb") as f:
+		np.savez(f, **arrays)
+	os.replace(tmp, path)
+
+def header(path):
+	with np.load(path) as data:
+		return json.loads(str(data["meta"]))
+
+def load(path, engine=None):
+	# restore a checkpoint into engine (a new CellEngine when None), returns the engine and the
+	# header; the step after a load is the step the saved run would have taken. A checkpoint of
+	# another model version is refused before anything is restored.
+	with np.load(path) as data:
+		meta = json.loads(str(data["meta"]))
+		if meta.get("model") != MODEL_VERSION:
+			raise ValueError("checkpoint {0} is from model version {1}, not {2}".format(path, meta.get("model"), MODEL_VERSION))
+		if engine is None:
+			engine = CellEngine(bounds=meta["bounds"], boundary=meta["boundary"])
+		engine.resize(len(data["ids"]))
+		for name in STATE:
+			getattr(engine, name)[:] = data[name]
+	for name in PARAMETERS:
+		setattr(engine, name, meta[name])
+	engine.rng.bit_generator.state = meta["rng"]
+	# occupancy grids are not saved, the next one counts every cell afresh
+	engine.bin[:] = -1
+	engine.occupancy = None
+	return engine, meta
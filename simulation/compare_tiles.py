@@ -0,0 +1,70 @@
+import argparse
+import sys
+import time
+import numpy as np
+import batch
+from engine import CellEngine
+from decomposition import TiledEngine
+
+METRICS = ("cells_final", "motile_fraction", "mean_speed", "wound_cells", "wound_coverage")
+
+def first_step(n, seed, tiles, workers):
+	# one step of the same x-sorted cells and random stream on both engines; the strips see the
+	# same grid buckets in the same order, so the positions come out bit for bit the same
+	engine = CellEngine(seed=seed)
+	engine.seed_cells(n)
+	for _ in range(5):
+		engine.step()
+	order = np.argsort(engine.pos[:, 0], kind="stable")
+	base = engine.snapshot()
+	single = CellEngine(seed=seed)
+	with TiledEngine(seed=seed, workers=workers, tiles=tiles) as tiled:
+		for e in (single, tiled):
+			e.load(base)
+			for name in e.buffers:
+				getattr(e, name)[:] = getattr(e, name)[order]
+			e.rng = np.random.default_rng(seed)
+			e.step()
+		return float(np.abs(single.pos - tiled.pos).max()), bool(np.array_equal(single.pos, tiled.pos))
+
+def statistics(seeds, cells, steps, tiles):
+	# the same runs single and tiled; trajectories part after the first division, so only the
+	# metrics over seeds are compared
+	runs = batch.make_runs([0.01], [0.01], [0.01], ["circle"], [3000.0], [3], [cells], list(range(seeds)), steps)
+	out = dict()
+	for label, t in (("single", None), ("tiled", tiles)):
+		start = time.time()
+		out[label] = np.array([[batch.run(p, tiles=t)[k] for k in METRICS] for p in runs], dtype=float)
+		print("{0:>6} {1} runs in {2:.1f} s".format(label, len(runs), time.time() - start))
+	return out["single"], out["tiled"]
+
+def agree(a, b, within):
+	# difference of the means against its standard error, per metric
+	diff = b.mean(axis=0) - a.mean(axis=0)
+	error = np.sqrt(a.var(axis=0, ddof=1) / len(a) + b.var(axis=0, ddof=1) / len(b))
+	return diff, error, (np.abs(diff) <= within * error) | (diff == 0)
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Check that the tiled engine matches the single one: bit for bit on a first step, in distribution over seeds.")
+	parser.add_argument("--cells", type=int, default=3000, help="starting cell count")
+	parser.add_argument("--seeds", type=int, default=6, help="runs per engine in the statistical check")
+	parser.add_argument("--steps", type=int, default=150, help="steps per run")
+	parser.add_argument("--tiles", type=int, default=4, help="strips of the tiled engine")
+	parser.add_argument("--workers", type=int, default=2, help="worker processes of the tiled engine")
+	parser.add_argument("--within", type=float, default=3.0, help="allowed difference of means in standard errors")
+	return parser.parse_args(argv)
+
+def main(argv=None):
+	args = parse_args(argv)
+	diff, same = first_step(args.cells, 0, args.tiles, args.workers)
+	print("first step: max difference {0:.3g}, {1}".format(diff, "identical" if same else "DIFFERENT"))
+	single, tiled = statistics(args.seeds, args.cells, args.steps, args.tiles)
+	ok = same
+	for name, a, b, (d, e, good) in zip(METRICS, single.T, tiled.T, zip(*agree(single, tiled, args.within))):
+		print("{0:>16}  single {1:10.4f}  tiled {2:10.4f}  difference {3:8.4f} +- {4:.4f}  {5}".format(
+			name, a.mean(), b.mean(), d, e, "ok" if good else "DIFFERS"))
+		ok = ok and bool(good)
+	return 0 if ok else 1
+
+if __name__ == '__main__':
+	sys.exit(main())
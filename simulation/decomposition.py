@@ -0,0 +1,151 @@
+import ctypes
+import multiprocessing
+from multiprocessing.sharedctypes import RawArray
+import numpy as np
+from engine import CellEngine, STATE, BOUNDS
+
+# per-cell arrays only the tiles need: who moves this step and where the tiles write their results
+SCRATCH = {
+	"moving": ((), bool),
+	"pos_next": ((2,), float),
+	"vel_next": ((2,), float),
+}
+
+# worker side: views on the coordinator's shared buffers and one engine reused for every tile
+SHARED = dict()
+LOCAL = None
+
+def shared_array(shape, dtype):
+	dtype = np.dtype(dtype)
+	raw = RawArray(ctypes.c_byte, max(int(np.prod(shape)) * dtype.itemsize, 1))
+	return raw, np.frombuffer(raw, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+
+def attach(raws, capacity):
+	global LOCAL
+	layout = dict(STATE)
+	layout.update(SCRATCH)
+	for name, raw in raws.items():
+		shape, dtype = layout[name]
+		SHARED[name] = np.frombuffer(raw, dtype=np.dtype(dtype), count=capacity * int(np.prod(shape))).reshape((capacity,) + shape)
+	LOCAL = CellEngine()
+
+def step_tile(tile):
+	# one strip: copy its rows plus the halo on either side, move the owned rows, write them back
+	lo, hi, halo_lo, halo_hi, stats, params = tile
+	local = LOCAL
+	for name, value in params.items():
+		setattr(local, name, value)
+	local.stats = stats
+	m = halo_hi - halo_lo
+	local.resize(m)
+	for name in ("pos", "vel", "force"):
+		getattr(local, name)[:] = SHARED[name][halo_lo:halo_hi]
+	local.active[:] = True
+
+	own = np.arange(lo - halo_lo, hi - halo_lo)
+	moving = own[SHARED["moving"][lo:hi]]
+	i, j = local.neighbor_pairs(np.arange(m))
+	# each pair is listed once, so it counts when either end is owned
+	owned = ((i >= own[0]) & (i <= own[-1])) | ((j >= own[0]) & (j <= own[-1]))
+	i, j = i[owned], j[owned]
+	if len(moving):
+		v1v2 = local.r1r2(i, j)[moving]
+		v3 = local.match_velocity(moving)
+		local.new_pos(moving, v1v2, v3)
+	SHARED["pos_next"][lo:hi] = local.pos[own]
+	SHARED["vel_next"][lo:hi] = local.vel[own]
+	# absorbed cells, no other tile reads these rows
+	SHARED["active"][lo:hi] = local.active[own]
+	return len(i)
+
+class TiledEngine(CellEngine):
+	# CellEngine whose neighbor search and force update run on a process pool, one vertical strip
+	# of the box per task. Cell state lives in shared memory sorted by x at the start of every step,
+	# so a strip and its halo are contiguous rows and a cell crossing a strip border migrates by
+	# that sort. Division, switching, the random draws and the population aggregates stay here.
+	def __init__(self, r1 = 0.01, r2 = 0.01, r3 = 0.01, seed = None, bounds = BOUNDS, boundary = "reflective",
+			workers = None, tiles = None):
+		if boundary == "periodic":
+			# the strip halos stop at the box edges
+			raise ValueError("TiledEngine does not support periodic boundaries")
+		self.workers = workers or multiprocessing.cpu_count()
+		self.tiles = tiles or self.workers
+		self.pool = None
+		self.raws = dict()
+		self.scratch = dict()
+		super(TiledEngine, self).__init__(r1, r2, r3, seed, bounds, boundary)
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self):
+		if self.pool is not None:
+			self.pool.terminate()
+			self.pool.join()
+			self.pool = None
+
+	def reserve(self, capacity):
+		# same doubling as CellEngine, into shared buffers; the workers map buffers at start up so
+		# the pool is restarted on the next step
+		if capacity <= self.capacity:
+			return
+		capacity = max(capacity, 2 * self.capacity, 1024)
+		for name, old in self.buffers.items():
+			self.raws[name], new = shared_array((capacity,) + old.shape[1:], old.dtype)
+			new[:self.n] = old[:self.n]
+			self.buffers[name] = new
+		for name, (shape, dtype) in SCRATCH.items():
+			self.raws[name], self.scratch[name] = shared_array((capacity,) + shape, dtype)
+		self.capacity = capacity
+		self.close()
+
+	def start(self):
+		if self.pool is None:
+			self.pool = multiprocessing.Pool(self.workers, initializer=attach, initargs=(self.raws, self.capacity))
+
+	def sort_strips(self):
+		# migration: reorder every row by x so each strip owns one contiguous block; marked rows
+		# are numbered before the sort, they are counted first
+		if self.occupancy is not None:
+			self.occupancy.update(self)
+		order = np.argsort(self.pos[:, 0], kind="stable")
+		for buf in self.buffers.values():
+			buf[:self.n] = buf[order]
+		self.views()
+
+	def strips(self, stats):
+		# equal cell counts per strip, halos reach one interaction radius past either edge
+		x = self.pos[:, 0]
+		r = self.interaction_radius
+		params = {"r1coeff": self.r1coeff, "r2coeff": self.r2coeff, "r3coeff": self.r3coeff,
+			"speed": self.speed, "interaction_radius": r, "bounds": self.bounds, "boundary": self.boundary}
+		cuts = np.linspace(0, self.n, self.tiles + 1).astype(np.intp)
+		tiles = list()
+		for lo, hi in zip(cuts[:-1], cuts[1:]):
+			if hi > lo:
+				halo_lo = int(np.searchsorted(x, x[lo] - r, "left"))
+				halo_hi = int(np.searchsorted(x, x[hi - 1] + r, "right"))
+				tiles.append((int(lo), int(hi), halo_lo, halo_hi, stats, params))
+		return tiles
+
+	def step(self):
+		if self.num_active() < len(self):
+			self.compact()
+		with self.profiler.phase("neighbor"):
+			self.sort_strips()
+		super(TiledEngine, self).step()
+
+	def displace(self, idx, moving):
+		n = self.n
+		self.start()
+		self.scratch["moving"][:n] = False
+		self.scratch["moving"][moving] = True
+		with self.profiler.phase("force"):
+			pairs = self.pool.map(step_tile, self.strips(self.stats), chunksize=1)
+			self.pos[:] = self.scratch["pos_next"][:n]
+			self.vel[:] = self.scratch["vel_next"][:n]
+		self.moved(moving)
+		self.profiler.count("pairs", sum(pairs))
@@ -0,0 +1,355 @@
+import numpy as np
+from spatial import CellGrid, periodic_images
+import forces
+from profiling import Profiler
+import seeding
+
+# default side of the square box the cells live in
+BOUNDS = 256.0
+
+# what happens to a cell that moves out of the box
+BOUNDARIES = ("reflective", "periodic", "absorbing")
+
+# bump whenever a change alters what a run produces, cached results of older versions stop matching
+MODEL_VERSION = 4
+
+# per-cell arrays: row shape and dtype, each as narrow as its values allow (68 bytes a cell)
+STATE = {
+	"pos": ((2,), float),
+	"vel": ((2,), float),
+	"force": ((2,), float),
+	# 8 to 12
+	"radius": ((), np.int16),
+	"motile": ((), bool),
+	# one of three switching probabilities
+	"switch": ((), np.float32),
+	"active": ((), bool),
+	"ids": ((), np.int64),
+	# occupancy grid bin the cell was last counted in, -1 while uncounted
+	"bin": ((), np.int32),
+}
+
+def row_nbytes():
+	return sum(np.dtype(dtype).itemsize * int(np.prod(shape)) for shape, dtype in STATE.values())
+
+class Aggregates():
+	# population sums and means over the active cells, reduced once per step and shared
+	def __init__(self, pos, vel):
+		self.n = len(pos)
+		self.pos_sum = pos.sum(axis=0)
+		self.vel_sum = vel.sum(axis=0)
+		self.avpos = self.pos_sum / max(self.n, 1)
+		self.avvel = self.vel_sum / max(self.n, 1)
+		self.vx_fraction = np.count_nonzero(vel[:, 0] > 0) / max(self.n, 1)
+		self.vy_fraction = np.count_nonzero((vel[:, 0] <= 0) & (vel[:, 1] > 0)) / max(self.n, 1)
+
+	def percieved_center(self, pos):
+		# leave-one-out center of mass for each row of pos
+		if self.n < 2:
+			return np.zeros_like(pos)
+		return (self.pos_sum - pos) / (self.n - 1)
+
+	def percieved_vel(self, vel):
+		# leave-one-out mean velocity for each row of vel
+		if self.n < 2:
+			return np.zeros_like(vel)
+		return (self.vel_sum - vel) / (self.n - 1)
+
+class Snapshot():
+	# read-only copy of an engine's active cells, safe to hand to another thread
+	def __init__(self, engine):
+		alive = np.flatnonzero(engine.active)
+		for name in STATE:
+			arr = getattr(engine, name)[alive]
+			arr.flags.writeable = False
+			setattr(self, name, arr)
+		self.steps = engine.steps
+		self.stats = engine.stats
+
+	def __len__(self):
+		return len(self.ids)
+
+	def num_active(self):
+		return len(self)
+
+class CellEngine():
+	def __init__(self, r1 = 0.01, r2 = 0.01, r3 = 0.01, seed = None, bounds = BOUNDS, boundary = "reflective"):
+		if boundary not in BOUNDARIES:
+			raise ValueError("unknown boundary {0}".format(boundary))
+		# every stochastic decision comes from this stream, seed takes anything default_rng does
+		self.rng = np.random.default_rng(seed)
+		self.r1coeff = max(r1, 0.01)
+		self.r2coeff = max(r2, 0.01)
+		self.r3coeff = max(r3, 0.01)
+		self.div_coeff = 50
+		self.speed = 0.5
+		self.interaction_radius = 20.0
+		self.bounds = float(bounds)
+		self.boundary = boundary
+		self.motility_switch_nonmotile = 0.01
+		self.steps = 0
+		self.stats = Aggregates(np.zeros((0, 2)), np.zeros((0, 2)))
+		self.grid = CellGrid(self.interaction_radius)
+		self.kernel = forces.PairKernel()
+		self.profiler = Profiler()
+		# occupancy grid counting these cells, told about every row that moves, appears or goes
+		self.occupancy = None
+
+		# per-cell state lives in capacity-doubling buffers, the public arrays are views of the first n rows
+		self.n = 0
+		self.capacity = 0
+		self.buffers = dict()
+		for name, (shape, dtype) in STATE.items():
+			self.buffers[name] = np.zeros((0,) + shape, dtype=dtype)
+		self.next_id = 0
+		self.views()
+
+	def __len__(self):
+		return self.n
+
+	def views(self):
+		for name in STATE:
+			setattr(self, name, self.buffers[name][:self.n])
+
+	def reserve(self, capacity):
+		# doubling keeps appends amortized O(1) as proliferation grows the population
+		if capacity <= self.capacity:
+			return
+		capacity = max(capacity, 2 * self.capacity, 1024)
+		for name, old in self.buffers.items():
+			new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+			new[:self.n] = old[:self.n]
+			self.buffers[name] = new
+		self.capacity = capacity
+
+	def resize(self, n):
+		self.reserve(n)
+		self.n = n
+		self.views()
+
+	def set_coeffs(self, r1, r2, r3):
+		self.r1coeff = r1
+		self.r2coeff = r2
+		self.r3coeff = r3
+
+	def add_cells(self, xy):
+		xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+		n = len(xy)
+		start = self.n
+		self.resize(start + n)
+		new = slice(start, start + n)
+		self.pos[new] = xy
+		self.vel[new] = 0.0
+		self.force[new] = self.rng.integers(-10, 10, (n, 2)) * 0.1
+		self.radius[new] = 8
+		self.motile[new] = False
+		self.switch[new] = 0.005
+		self.active[new] = True
+		self.ids[new] = np.arange(self.next_id, self.next_id + n)
+		self.bin[new] = -1
+		self.next_id += n
+		rows = np.arange(start, start + n)
+		self.moved(rows)
+		return rows
+
+	def seed_cells(self, n, method="random"):
+		# n new cells placed by one of seeding.SEEDINGS over the whole box
+		return self.add_cells(seeding.place(self.rng, n, self.bounds, method))
+
+	def add_cell(self, x, y):
+		return self.add_cells([x, y])[0]
+
+	def divide(self):
+		# every cell that reached full size splits at once, the daughters are appended as one block
+		with self.profiler.phase("division"):
+			idx = np.flatnonzero(self.active & (self.radius >= 12))
+			self.profiler.count("divisions", len(idx))
+			if len(idx) == 0:
+				return idx
+			new = self.add_cells(self.pos[idx] - 1)
+			self.vel[new] = -self.vel[idx]
+			self.pos[idx] += 1
+			self.radius[idx] = 8
+			self.apply_boundary(np.concatenate((idx, new)))
+		return new
+
+	def compact(self):
+		# drop inactive rows in one pass, returns the old row index of every kept row
+		with self.profiler.phase("wound"):
+			if self.occupancy is not None:
+				# marked rows are numbered before compaction, they are counted first
+				self.occupancy.update(self)
+				self.occupancy.drop(self.bin[~self.active])
+			keep = np.flatnonzero(self.active)
+			k = len(keep)
+			for name, buf in self.buffers.items():
+				buf[:k] = buf[keep]
+			self.n = k
+			self.views()
+		return keep
+
+	def remove(self, mask):
+		self.active[mask] = False
+		return self.compact()
+
+	def num_active(self):
+		return int(np.count_nonzero(self.active))
+
+	def snapshot(self):
+		return Snapshot(self)
+
+	def load(self, snapshot):
+		# replace this engine's cells with the ones in a snapshot
+		self.resize(len(snapshot))
+		for name in STATE:
+			getattr(self, name)[:] = getattr(snapshot, name)
+		self.steps = snapshot.steps
+		self.stats = snapshot.stats
+
+	def period(self):
+		return self.bounds if self.boundary == "periodic" else None
+
+	def neighbor_pairs(self, idx):
+		# every pair of idx rows within the interaction radius, listed once
+		if self.period() is None:
+			self.grid.build(self.spread(self.pos[idx], idx), idx)
+			return self.grid.half_pairs(self.interaction_radius)
+		# wrapped pairs come from shifted copies of the cells along the edges; a wrapped pair is
+		# found from either end, the copy of the higher index against the lower one is kept
+		pos, source = periodic_images(self.pos[idx], self.bounds, self.interaction_radius)
+		self.grid.build(self.spread(pos, idx[source]))
+		i, j = self.grid.half_pairs(self.interaction_radius)
+		ri, rj = i < len(idx), j < len(idx)
+		si, sj = source[i], source[j]
+		keep = (ri & rj) | (ri & ~rj & (si < sj)) | (~ri & rj & (sj < si))
+		return idx[si[keep]], idx[sj[keep]]
+
+	def spread(self, pos, rows):
+		# where the neighbor search sees rows, cells that must never interact can be moved apart
+		return pos
+
+	def r1r2(self, i, j):
+		# repulsion r2/(d - 1) and attraction r1 summed over each cell's neighbors
+		return self.kernel.r1r2(self.pos, i, j, self.r1coeff, self.r2coeff, self.interaction_radius,
+			period=self.period(), mutual=True)
+
+	def nbytes(self):
+		# per-cell storage held, buffers included
+		return sum(buf.nbytes for buf in self.buffers.values())
+
+	def aggregates(self):
+		idx = np.flatnonzero(self.active)
+		return Aggregates(self.pos[idx], self.vel[idx])
+
+	def match_velocity(self, idx):
+		pv = self.stats.percieved_vel(self.vel[idx])
+		norm = np.linalg.norm(pv, axis=1)
+		big = norm > 0.001
+		pv[big] /= norm[big, None]
+		return pv * self.r3coeff
+
+	def switch_motile(self, idx, force=None):
+		if force is None:
+			force = self.rng.integers(-10, 10, (len(idx), 2)) * 0.1
+		self.motile[idx] = True
+		self.force[idx] = force
+
+	def switch_nonmotile(self, idx):
+		self.motile[idx] = False
+
+	def update_switch(self, idx):
+		aligned = np.einsum('ij,ij->i', self.force[idx], self.vel[idx]) > 0
+		self.switch[idx] = np.where(aligned, 0.01, 0.1)
+
+	def new_pos(self, idx, v1v2, v3):
+		nv = v1v2 + v3 + self.vel[idx] + self.force[idx]
+		norm = np.linalg.norm(nv, axis=1)
+		nz = norm > 0
+		nv[nz] /= norm[nz, None]
+		nv *= self.speed
+		self.vel[idx] = nv
+		self.pos[idx] += nv
+		self.apply_boundary(idx)
+
+	def moved(self, rows):
+		if self.occupancy is not None:
+			self.occupancy.mark(rows)
+
+	def apply_boundary(self, idx):
+		self.moved(idx)
+		pos = self.pos[idx]
+		if self.boundary == "periodic":
+			self.pos[idx] = pos % self.bounds
+			return
+		low, high = pos < 0, pos > self.bounds
+		out = low | high
+		if self.boundary == "absorbing":
+			# cells that leave are gone, their rows go at the next compaction
+			self.active[idx[out.any(axis=1)]] = False
+			return
+		# mirror back into the box and turn the velocity component around
+		pos = np.where(low, -pos, np.where(high, 2 * self.bounds - pos, pos))
+		vel = np.where(out, -self.vel[idx], self.vel[idx])
+		far = (pos < 0) | (pos > self.bounds)
+		if far.any():
+			# more than a box away (a box that just shrank), fold over [0, 2 bounds): past the
+			# middle the cell has come back off the far wall once more
+			folded = pos[far] % (2 * self.bounds)
+			back = folded > self.bounds
+			pos[far] = np.where(back, 2 * self.bounds - folded, folded)
+			vel[far] = np.where(back, -vel[far], vel[far])
+		self.pos[idx] = pos
+		self.vel[idx] = vel
+
+	def set_bounds(self, bounds):
+		# a new box side; cells a shrink leaves outside are brought back by the boundary rule
+		self.bounds = float(bounds)
+		idx = np.flatnonzero(self.active)
+		if len(idx):
+			self.apply_boundary(idx)
+
+	def step(self):
+		idx = np.flatnonzero(self.active)
+		self.steps += 1
+		self.stats = Aggregates(self.pos[idx], self.vel[idx])
+		self.profiler.count("cells", len(idx))
+		if len(idx):
+			self.move(idx)
+		self.profiler.end_step(self.steps)
+
+	def move(self, idx):
+		moving = self.motility(idx)
+		if len(moving):
+			self.displace(idx, moving)
+
+	def motility(self, idx):
+		# growth and motility switching for the active rows, returns the rows that move this step
+		n = len(idx)
+		with self.profiler.phase("motility"):
+			# the whole step's randomness in one draw: growth roll, switch roll, new motile force
+			draws = self.rng.integers(0, (self.div_coeff, 1000, 20, 20), size = (n, 4))
+
+			# radius growth towards division
+			grow = draws[:, 0] < 2
+			self.radius[idx[grow]] += 1
+
+			# motility state switching
+			roll = draws[:, 1]
+			motile = self.motile[idx]
+			on = ~motile & (roll < 1000 * self.motility_switch_nonmotile)
+			off = motile & (roll < 1000 * self.switch[idx])
+			self.switch_motile(idx[on], (draws[on, 2:] - 10) * 0.1)
+			self.switch_nonmotile(idx[off])
+			moving = idx[on | (motile & ~off)]
+			self.update_switch(moving)
+		return moving
+
+	def displace(self, idx, moving):
+		# velocity and position update for the moving cells
+		with self.profiler.phase("neighbor"):
+			i, j = self.neighbor_pairs(idx)
+		self.profiler.count("pairs", len(i))
+		with self.profiler.phase("force"):
+			v1v2 = self.r1r2(i, j)[moving]
+			v3 = self.match_velocity(moving)
+			self.new_pos(moving, v1v2, v3)
@@ -0,0 +1,102 @@
+import numpy as np
+from engine import CellEngine, BOUNDS
+import seeding
+from wound import wound_mask
+
+class EnsembleEngine(CellEngine):
+	# K independent replicas stepped as one population: every row carries its replica, the
+	# neighbor search sees each replica's box shifted along x by more than the interaction
+	# radius so no pair crosses replicas, and the population means and the r1/r2/r3
+	# coefficients are looked up per replica. Division, motility and the force kernel run once
+	# over all rows. The replicas share one random stream, so they are independent of each
+	# other but do not repeat the single runs of the same seeds step for step.
+	def __init__(self, replicas, r1 = 0.01, r2 = 0.01, r3 = 0.01, seed = None, bounds = BOUNDS, boundary = "reflective"):
+		self.replicas = replicas
+		super(EnsembleEngine, self).__init__(0.01, 0.01, 0.01, seed, bounds, boundary)
+		self.buffers["replica"] = np.zeros(0, dtype=np.int32)
+		self.views()
+		self.set_coeffs(r1, r2, r3)
+		self.counts = np.zeros(replicas, dtype=np.int64)
+		self.vel_sums = np.zeros((replicas, 2))
+
+	def views(self):
+		super(EnsembleEngine, self).views()
+		if "replica" in self.buffers:
+			self.replica = self.buffers["replica"][:self.n]
+
+	def set_coeffs(self, r1, r2, r3):
+		# one value for every replica or one value each
+		self.r1 = np.broadcast_to(np.asarray(r1, dtype=float), (self.replicas,)).copy()
+		self.r2 = np.broadcast_to(np.asarray(r2, dtype=float), (self.replicas,)).copy()
+		self.r3 = np.broadcast_to(np.asarray(r3, dtype=float), (self.replicas,)).copy()
+		super(EnsembleEngine, self).set_coeffs(self.r1[0], self.r2[0], self.r3[0])
+
+	def add_cells(self, xy, replica=0):
+		rows = super(EnsembleEngine, self).add_cells(xy)
+		self.replica[rows] = replica
+		return rows
+
+	def seed_cells(self, n, method="random", seeds=None):
+		# n cells in every replica, each laid out from its own seed so a replica starts where the
+		# single run of that seed starts
+		if seeds is None:
+			seeds = self.rng.integers(0, 2 ** 63, self.replicas)
+		rows = list()
+		for k, seed in enumerate(seeds):
+			rows.append(self.add_cells(seeding.place(np.random.default_rng(seed), n, self.bounds, method), k))
+		return np.concatenate(rows)
+
+	def divide(self):
+		parents = np.flatnonzero(self.active & (self.radius >= 12))
+		new = super(EnsembleEngine, self).divide()
+		self.replica[new] = self.replica[parents]
+		return new
+
+	def cut_wound(self, geometry, area, angles=3):
+		# the same wound in the middle of every replica's box, returns the cells removed per replica
+		center = (self.bounds / 2, self.bounds / 2)
+		hit = wound_mask(self.pos, geometry, area, angles, center, self.bounds)
+		removed = np.bincount(self.replica[hit], minlength=self.replicas)
+		self.remove(hit)
+		return removed
+
+	def spread(self, pos, rows):
+		stride = self.bounds + 2 * self.interaction_radius
+		out = pos.copy()
+		out[:, 0] += stride * self.replica[rows]
+		return out
+
+	def step(self):
+		# the population sums match_velocity leaves each cell out of, one set per replica
+		alive = np.flatnonzero(self.active)
+		rep = self.replica[alive]
+		self.counts = np.bincount(rep, minlength=self.replicas)
+		for axis in (0, 1):
+			self.vel_sums[:, axis] = np.bincount(rep, weights=self.vel[alive, axis], minlength=self.replicas)
+		super(EnsembleEngine, self).step()
+
+	def r1r2(self, i, j):
+		rep = self.replica[i]
+		return self.kernel.r1r2(self.pos, i, j, self.r1[rep], self.r2[rep], self.interaction_radius,
+			period=self.period(), mutual=True)
+
+	def match_velocity(self, idx):
+		rep = self.replica[idx]
+		others = self.counts[rep] - 1
+		pv = (self.vel_sums[rep] - self.vel[idx]) / np.maximum(others, 1)[:, None]
+		pv[others < 1] = 0.0
+		norm = np.linalg.norm(pv, axis=1)
+		big = norm > 0.001
+		pv[big] /= norm[big, None]
+		return pv * self.r3[rep, None]
+
+	def member(self, k):
+		# replica k on its own, as a plain engine holding copies of its rows
+		rows = np.flatnonzero(self.replica == k)
+		engine = CellEngine(self.r1[k], self.r2[k], self.r3[k], bounds=self.bounds, boundary=self.boundary)
+		engine.resize(len(rows))
+		for name in self.buffers:
+			if name != "replica":
+				getattr(engine, name)[:] = getattr(self, name)[rows]
+		engine.steps = self.steps
+		return engine
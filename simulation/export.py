@@ -0,0 +1,132 @@
+import argparse
+import json
+import os
+from engine import CellEngine
+from trajectory import Trajectory, load_frame
+from wound import SCENE_SIZE as SCENE
+FORMATS = ("png", "raw")
+
+# worker side: the trajectory, one engine container and the frame settings, set up once per process
+WORKER = dict()
+
+def application():
+	# text and some paint engines want a QGuiApplication, reuse the dialog's when there is one
+	os.environ.setdefault("QT_QPA_PLATFORM", "offscreen")
+	from PyQt5.QtGui import QGuiApplication
+	return QGuiApplication.instance() or QGuiApplication(["export"])
+
+def render(engine, wound=None, size=512, detail="cells", bounds=None):
+	# one frame of an engine's active cells as the dialog draws it: background, the batched cell
+	# shapes and the wound outline (a path in scene units), at size x size pixels
+	from PyQt5.QtCore import Qt
+	from PyQt5.QtGui import QImage, QPainter, QPen
+	from renderer import PopulationGraphicsItem, SCENE_RECT, BACKGROUND_COLOR, WOUND_COLOR, WOUND_WIDTH
+
+	image = QImage(size, size, QImage.Format_RGBA8888)
+	image.fill(BACKGROUND_COLOR)
+	painter = QPainter(image)
+	painter.scale(size / SCENE, size / SCENE)
+	item = PopulationGraphicsItem(engine, SCENE_RECT, SCENE / (bounds or engine.bounds))
+	item.detail = detail
+	item.paintCells(painter)
+	if wound is not None:
+		pen = QPen(WOUND_COLOR)
+		pen.setWidth(WOUND_WIDTH)
+		painter.setPen(pen)
+		painter.setBrush(Qt.NoBrush)
+		painter.drawPath(wound)
+	painter.end()
+	return image
+
+def scene_wound(params):
+	# wound sizes are in scene units, the outline is drawn like drawWound's
+	from renderer import wound_path
+	return wound_path(params["geometry"], params["area"], params["angles"] or 3, SCENE)
+
+def image_bytes(image):
+	bits = image.constBits()
+	bits.setsize(image.byteCount())
+	return bytes(bits)
+
+def frame_path(out, k):
+	return os.path.join(out, "frame_{0:05d}.png".format(k))
+
+def attach(path, bounds, wound, size, detail, out, fmt):
+	application()
+	WORKER.update({"trajectory": Trajectory(path), "engine": CellEngine(bounds=bounds),
+		"wound": scene_wound(wound) if wound else None,
+		"size": size, "detail": detail, "out": out, "format": fmt})
+
+def render_task(task):
+	# numbered output frame k from recorded frame index; PNGs are written here, raw frames go back
+	# to the parent so the stream stays in order
+	k, index = task
+	engine = WORKER["engine"]
+	load_frame(engine, WORKER["trajectory"].frame(index))
+	image = render(engine, WORKER["wound"], WORKER["size"], WORKER["detail"])
+	if WORKER["format"] == "png":
+		image.save(frame_path(WORKER["out"], k))
+		return None
+	return image_bytes(image)
+
+def run_params(path):
+	# batch writes run_XXXXX.json next to run_XXXXX.traj, its params give the box and the wound
+	base = os.path.splitext(path.rstrip(os.sep))[0]
+	if os.path.exists(base + ".json"):
+		with open(base + ".json") as f:
+			return json.load(f)["params"]
+	return None
+
+def export(path, out, params=None, size=512, every=1, start=0, stop=None, fmt="png", detail="cells",
+		wound=True, workers=None):
+	# rasterize recorded frames [start, stop) every so many on a process pool
+	import multiprocessing
+	os.makedirs(out, exist_ok=True)
+	if params is None:
+		params = run_params(path)
+	trajectory = Trajectory(path)
+	bounds = params["bounds"] if params else trajectory.bounds
+	shape = params if params and wound else None
+	indices = list(range(start, len(trajectory) if stop is None else min(stop, len(trajectory)), every))
+	tasks = list(enumerate(indices))
+
+	meta = {"trajectory": os.path.abspath(path), "frames": len(tasks), "width": size, "height": size,
+		"steps": [int(trajectory.steps[i]) for i in indices], "bounds": bounds, "format": fmt}
+	if fmt == "raw":
+		# ffmpeg -f rawvideo -pix_fmt rgba -s WxH -i frames.rgba
+		meta["pixel_format"] = "rgba"
+	stream = open(os.path.join(out, "frames.rgba"), "wb") if fmt == "raw" else None
+	# spawn, a forked child would inherit the parent's Qt state
+	context = multiprocessing.get_context("spawn")
+	with context.Pool(workers, initializer=attach, initargs=(path, bounds, shape, size, detail, out, fmt)) as pool:
+		for data in pool.imap(render_task, tasks, chunksize=4):
+			if stream:
+				stream.write(data)
+	if stream:
+		stream.close()
+	with open(os.path.join(out, "frames.json"), "w") as f:
+		json.dump(meta, f, indent=1)
+	return len(tasks)
+
+def parse_args(argv=None):
+	parser = argparse.ArgumentParser(description="Render a recorded trajectory to a PNG sequence or raw RGBA stream.")
+	parser.add_argument("trajectory", help="trajectory directory, e.g. runs/run_00000.traj")
+	parser.add_argument("--out", default="frames", help="output directory")
+	parser.add_argument("--format", default="png", choices=FORMATS, help="numbered PNGs or one raw RGBA stream")
+	parser.add_argument("--size", type=int, default=512, help="frame side in pixels")
+	parser.add_argument("--every", type=int, default=1, help="recorded frames between exported ones")
+	parser.add_argument("--start", type=int, default=0, help="first recorded frame")
+	parser.add_argument("--stop", type=int, help="recorded frame to stop before")
+	parser.add_argument("--detail", default="cells", choices=("cells", "heatmap"), help="cell shapes or density heatmap")
+	parser.add_argument("--no-wound", action="store_true", help="leave out the wound outline")
+	parser.add_argument("--workers", type=int, default=os.cpu_count(), help="worker processes")
+	return parser.parse_args(argv)
+
+def main(argv=None):
+	args = parse_args(argv)
+	n = export(args.trajectory, args.out, size=args.size, every=args.every, start=args.start, stop=args.stop,
+		fmt=args.format, detail=args.detail, wound=not args.no_wound, workers=args.workers)
+	print("{0} frames in {1}".format(n, args.out))
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,74 @@
+import numpy as np
+from spatial import grown
+
+def scatter_add(n, i, values, out=None):
+	# sum per-pair 2d vectors into their owning cells
+	if out is None:
+		out = np.zeros((n, 2))
+	out[:, 0] += np.bincount(i, weights=values[:, 0], minlength=n)
+	out[:, 1] += np.bincount(i, weights=values[:, 1], minlength=n)
+	return out
+
+class PairKernel():
+	# batched pair force kernel. Per-pair intermediates go into buffers kept from step to step and
+	# only grown, like CellGrid's; the forces r1r2 returns are a view the next call overwrites.
+	def __init__(self):
+		self.buffers = dict((name, np.zeros((0,) + shape, dtype=dtype)) for name, shape, dtype in (
+			("r", (2,), float), ("other", (2,), float), ("d", (), float), ("unit", (), float),
+			("mask", (), bool), ("out", (2,), float)))
+
+	def buffer(self, name, n):
+		buf = grown(self.buffers[name], n)
+		self.buffers[name] = buf
+		return buf[:n]
+
+	def r1r2_pairs(self, pos, i, j, r1, r2, cutoff=None, period=None):
+		# r2/(d - 1) - r1 along the unit vector from j to i, one row per pair; pairs past the
+		# cutoff are dropped, returns the kept i, j and the per-pair forces
+		m = len(i)
+		r, other = self.buffer("r", m), self.buffer("other", m)
+		np.take(pos, i, axis=0, out=r, mode="clip")
+		r -= np.take(pos, j, axis=0, out=other, mode="clip")
+		if period is not None:
+			# nearest image across a periodic box
+			np.divide(r, period, out=other)
+			np.rint(other, out=other)
+			other *= period
+			r -= other
+		d = self.buffer("d", m)
+		np.einsum('ij,ij->i', r, r, out=d)
+		np.sqrt(d, out=d)
+		mask = self.buffer("mask", m)
+		if cutoff is not None and not np.less_equal(d, cutoff, out=mask).all():
+			# the grid already kept pairs within about the cutoff, so this copy is rare; coefficients
+			# may be given per pair
+			i, j, r, d = i[mask], j[mask], r[mask], d[mask]
+			if np.ndim(r1):
+				r1 = r1[mask]
+			if np.ndim(r2):
+				r2 = r2[mask]
+			mask = mask[:len(d)]
+		# coincident cells have r == 0 and so contribute nothing, like the unnormalized r did
+		unit = self.buffer("unit", len(d))
+		np.copyto(unit, d)
+		np.copyto(unit, 1.0, where=np.less_equal(d, 0, out=mask))
+		np.copyto(d, 1.1, where=np.equal(d, 1, out=mask))
+		d -= 1
+		np.divide(r2, d, out=d)
+		d -= r1
+		d /= unit
+		np.negative(d, out=d)
+		r *= d[:, None]
+		return i, j, r
+
+	def r1r2(self, pos, i, j, r1, r2, cutoff=None, period=None, mutual=False):
+		# scatter-adds every pair into per-cell force rows; the force is odd in r, so mutual pairs
+		# are listed once and push j with the opposite of what i gets
+		i, j, f = self.r1r2_pairs(pos, i, j, r1, r2, cutoff, period)
+		out = self.buffer("out", len(pos))
+		out[:] = 0.0
+		scatter_add(len(pos), i, f, out)
+		if mutual:
+			out[:, 0] -= np.bincount(j, weights=f[:, 0], minlength=len(pos))
+			out[:, 1] -= np.bincount(j, weights=f[:, 1], minlength=len(pos))
+		return out
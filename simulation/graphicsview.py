@@ -1,10 +1,19 @@
 import numpy as np 
 import sys
-from cell import CellGraphicsItem as Cell
-from PyQt5.QtCore import QObject, QDateTime, Qt, QTimer, QPoint, QRect, QRectF, QPropertyAnimation, QParallelAnimationGroup
+import threading
+from engine import CellEngine, BOUNDS, BOUNDARIES
+from profiling import Profiler
+from wound import wound_mask, SCENE_SIZE
+from seeding import SEEDINGS
+import checkpoint
+
+# steps of timings the dialog holds on to
+PROFILE_ROWS = 10000
 
 class SceneState():
-	def __init__(self, wound = False, area = 100.0, angles=2, geometry="line"):
+	# model side of the dialog, importable without Qt: the graphics items (cell, renderer) are only
+	# imported once something is drawn into a scene, a headless SceneState never loads them
+	def __init__(self, wound = False, area = 100.0, angles=2, geometry="line", seed=None, bounds=BOUNDS, boundary="reflective"):
 		self.angles = angles
 		self.area = area
 		self.timefactor = 1.0
@@ -14,10 +23,95 @@ class SceneState():
 		self.r2coeff = 0.01
 		self.r3coeff = 0.01
 		self.division_rate = 1000
+		# the model lives in engine and may be stepped from a worker thread under lock, the scene
+		# draws view, a copy of the latest published snapshot; cells[k] draws view row k
 		self.cells = list()
-		self.visible_cells = list()
 		self.cell_coords = list()
 		self.graphicsScene = None
+		# side of the square scene the engine's box is drawn into
+		self.sceneSize = SCENE_SIZE
+		self.engine = CellEngine(self.r1coeff, self.r2coeff, self.r3coeff, seed, bounds, boundary)
+		# the dialog runs open ended, its timings are capped
+		self.engine.profiler = Profiler(keep=PROFILE_ROWS)
+		self.lock = threading.RLock()
+		self.latest = self.engine.snapshot()
+		self.view = CellEngine()
+		self.view.profiler = self.engine.profiler
+		self.presented = None
+		# ids of the cells the last wound or removal took out, restoreCells brings back those whose
+		# rows have not been compacted away since
+		self.removed = None
+		self.shown = 0
+		self.hidden = False
+		# single item painting the whole population, replaces the per-cell items when set
+		self.population = None
+		# level of detail of the population item, see renderer.DETAILS
+		self.detail = "auto"
+		self.direction = False
+		# how new populations are laid out, see seeding.SEEDINGS
+		self.seeding = "random"
+
+	@property
+	def visible_cells(self):
+		return self.cells[:self.shown]
+
+	@property
+	def sceneScale(self):
+		return self.sceneSize / self.engine.bounds
+
+	@property
+	def batched(self):
+		return self.population is not None
+
+	def setBatched(self, batched, graphicsScene, rect=None):
+		if batched == self.batched:
+			return
+		from renderer import PopulationGraphicsItem, SCENE_RECT
+		if rect is None:
+			rect = SCENE_RECT
+		hidden = self.hidden
+		self.hideItems(graphicsScene)
+		self.cells = list()
+		if batched:
+			self.population = PopulationGraphicsItem(self.view, rect, self.sceneScale)
+			self.population.detail = self.detail
+			self.population.direction = self.direction
+		else:
+			self.population = None
+		if not hidden:
+			self.showItems(graphicsScene)
+
+	def setDetail(self, detail):
+		from renderer import DETAILS
+		if detail not in DETAILS:
+			raise ValueError("unknown level of detail {0}".format(detail))
+		self.detail = detail
+		if self.batched:
+			self.population.detail = detail
+			self.population.update()
+
+	def setDirection(self, direction):
+		self.direction = direction
+		if self.batched:
+			self.population.direction = direction
+			self.population.update()
+
+	def hideItems(self, graphicsScene):
+		# take whatever draws this state out of the scene, the cells themselves are kept
+		if self.batched:
+			if self.population.scene():
+				graphicsScene.removeItem(self.population)
+		else:
+			for cell in self.visible_cells:
+				graphicsScene.removeItem(cell)
+		self.shown = 0
+		self.hidden = True
+
+	def showItems(self, graphicsScene):
+		self.hidden = False
+		if self.batched:
+			graphicsScene.addItem(self.population)
+		self.syncItems(graphicsScene)
 
 	def getGeometry(self):
 		return self.geometry
@@ -41,7 +135,6 @@ class SceneState():
 		self.angles = angles
 
 	def setArea(self, area):
-		print(area)
 		self.area = area
 
 	def setTimeFactor(self, timefactor):
@@ -50,9 +143,32 @@ class SceneState():
 	def setWound(self, wound):
 		self.iswound = wound
 
+	def getBounds(self):
+		return self.engine.bounds
+
+	def setBounds(self, bounds, graphicsScene):
+		# resize the box, the scene keeps its size so everything drawn rescales
+		with self.lock:
+			self.engine.set_bounds(bounds)
+		for cell in self.cells:
+			cell.sceneScale = self.sceneScale
+		if self.batched:
+			self.population.sceneScale = self.sceneScale
+		self.publish()
+		self.present(graphicsScene)
+
+	def getBoundary(self):
+		return self.engine.boundary
+
+	def setBoundary(self, boundary):
+		if boundary not in BOUNDARIES:
+			raise ValueError("unknown boundary {0}".format(boundary))
+		with self.lock:
+			self.engine.boundary = boundary
+
 	def updateCoeffs(self):
-		for cell in self.visible_cells:
-			cell.resetcoeffs(self.r1coeff, self.r2coeff, self.r3coeff)
+		with self.lock:
+			self.engine.set_coeffs(self.r1coeff, self.r2coeff, self.r3coeff)
 
 	def setR1(self, R1):
 		#print(R1, "\n")
@@ -69,65 +185,171 @@ class SceneState():
 
 
 	def addCell(self, x, y):
-		cell = Cell(x, y, self.r1coeff, self.r2coeff, self.r3coeff)
-		cell.setPos(x, y)
-		self.cells.append(cell)
+		with self.lock:
+			index = self.engine.add_cell(x, y)
 		self.cell_coords.append([x, y])
-		self.visible_cells.append(cell)
-		return cell
-
-	def update_cell_info(self, graphicsScene):
-		#self.updateCellCoords()
-		avpos = self.averagePosition()
-		avvel = self.averageVelocity()
-		#print("avpos ", avpos, " avvel: ", avvel)
-		vx = 0
-		vy = 0
-		for cell in self.visible_cells:
-			r = QRectF(cell.Y() - 10, cell.X() - 10, 40, 40)
-			cell.collisions = graphicsScene.items(r)
-			cell.avpos = avpos
-			cell.avvel = avvel
-			cell.num_cells = len(self.visible_cells)
-			
-			
-			if(cell.radius == 12):
-				nc = self.addCell(cell.X() - 1, cell.Y() - 1)
-				nc.setvel(-cell.vel()[0], -cell.vel()[1])
-				cell.setX(cell.X() + 1)
-				cell.setY(cell.Y() + 1)
-				cell.radius = 8
-
-				nc.collisions = graphicsScene.items(QRectF(nc.X() - 20, nc.Y() - 20, 40, 40))
-				nc.avpos = avpos
-				nc.avvel = avvel
-				nc.num_cells = len(self.visible_cells) + 1
-				self.graphicsScene.addItem(nc)
-			v = cell.vel()
-			if(v[0] > 0):
-				vx += 1
-			elif(v[1] > 0):
-				vy += 1
-
-
-		print("{0}, {1}\n".format(vx/len(self.visible_cells), vy/len(self.visible_cells)))
-
-		print("There are {0} cells in simulation\n".format(len(self.visible_cells)))
-
-
-	def removeCellGraphics(self, graphicsItem, graphicsScene):
-		if not graphicsItem in self.visible_cells:
+		return index
+
+	def addCells(self, xy, graphicsScene):
+		with self.lock:
+			index = self.engine.add_cells(xy)
+		self.publish()
+		self.present(graphicsScene)
+		return index
+
+	def seedCells(self, n, graphicsScene):
+		with self.lock:
+			index = self.engine.seed_cells(n, self.seeding)
+		self.publish()
+		self.present(graphicsScene)
+		return index
+
+	def getSeeding(self):
+		return self.seeding
+
+	def setSeeding(self, seeding):
+		if seeding not in SEEDINGS:
+			raise ValueError("unknown seeding {0}".format(seeding))
+		self.seeding = seeding
+
+	def reset(self, n, graphicsScene):
+		# a fresh population at step 0, laid out by the current seeding
+		with self.lock:
+			self.engine.resize(0)
+			self.engine.steps = 0
+			self.engine.next_id = 0
+			self.engine.profiler.clear()
+			self.removed = None
+			self.engine.seed_cells(n, self.seeding)
+		self.publish()
+		self.present(graphicsScene)
+
+	def saveCheckpoint(self, path):
+		wound = {"wound": self.iswound, "geometry": self.geometry, "area": self.area, "angles": self.angles}
+		with self.lock:
+			checkpoint.save(self.engine, path, wound, {"timefactor": self.timefactor, "seeding": self.seeding})
+
+	def loadCheckpoint(self, path, graphicsScene):
+		# the engine is restored in place, so a running worker and the view keep pointing at it
+		with self.lock:
+			engine, meta = checkpoint.load(path, self.engine)
+			self.removed = None
+			self.r1coeff, self.r2coeff, self.r3coeff = engine.r1coeff, engine.r2coeff, engine.r3coeff
+		wound = meta["wound"] or {}
+		self.iswound = wound.get("wound", False)
+		self.geometry = wound.get("geometry", self.geometry)
+		self.area = wound.get("area", self.area)
+		self.angles = wound.get("angles", self.angles)
+		extra = meta["extra"] or {}
+		self.timefactor = extra.get("timefactor", self.timefactor)
+		self.seeding = extra.get("seeding", self.seeding)
+		# the box may have changed size
+		for cell in self.cells:
+			cell.sceneScale = self.sceneScale
+		if self.batched:
+			self.population.sceneScale = self.sceneScale
+		self.publish()
+		self.present(graphicsScene)
+		return meta
+
+	def update_cell_info(self):
+		# all of this step's daughters come back from the engine as one block
+		self.engine.divide()
+
+	def step(self):
+		# drop wounded rows, divide, then the whole population moves in one engine step
+		with self.lock:
+			self.compact()
+			self.update_cell_info()
+			self.engine.step()
+
+	def publish(self):
+		# freeze the model as it is now, the next present() draws this
+		with self.lock:
+			self.latest = self.engine.snapshot()
+		return self.latest
+
+	def present(self, graphicsScene):
+		# GUI thread only: copy the latest snapshot into the view and move the items onto it
+		if graphicsScene is None:
+			# headless, nothing draws the view
 			return
-		else:
-			graphicsScene.removeItem(graphicsItem)
-			self.visible_cells.remove(graphicsItem)
-
-	def addCellGraphics(self, graphicsItem, graphicsScene):
-		if graphicsItem in self.visible_cells:
+		from renderer import HEATMAP_CELLS
+		snapshot = self.latest
+		if snapshot is self.presented:
 			return
-		else:
-			graphicsScene.addItem(graphicsItem)
-			self.visible_cells.append(graphicsItem)
+		self.presented = snapshot
+		self.view.load(snapshot)
+		if not self.batched and not self.hidden and self.detail != "cells" and len(self.view) > HEATMAP_CELLS:
+			# one item per cell is past what the scene can draw, hand over to the heatmap
+			self.setBatched(True, graphicsScene)
+		self.syncItems(graphicsScene)
+		graphicsScene.advance()
+
+	def removeCells(self, mask, graphicsScene):
+		# bulk removal, the engine rows only get flagged here and are compacted away later
+		with self.lock:
+			hit = np.zeros(len(self.engine), dtype=bool)
+			hit[mask] = True
+			self.takeOut(hit)
+		self.publish()
+		self.present(graphicsScene)
+
+	def restoreCells(self, graphicsScene):
+		# bring back the cells the last wound or removal took out, as far as they are still there;
+		# cells absorbed at the walls stay gone
+		with self.lock:
+			if self.removed is not None:
+				back = np.isin(self.engine.ids, self.removed)
+				self.engine.active[back] = True
+			self.removed = None
+		self.publish()
+		self.present(graphicsScene)
+
+	def takeOut(self, hit):
+		# deactivate the hit rows that are still active and remember which cells they were
+		hit &= self.engine.active
+		self.removed = self.engine.ids[hit].copy()
+		self.engine.active[hit] = False
+
+	def compact(self):
+		with self.lock:
+			if self.engine.num_active() < len(self.engine):
+				self.engine.compact()
+
+	def scenePositions(self):
+		return self.sceneScale * self.engine.pos
+
+	def cutWound(self, graphicsScene, center=None, width=None):
+		# wound shape, in scene units, tested against every cell position at once
+		if center is None:
+			center = (self.sceneSize / 2, self.sceneSize / 2)
+		if width is None:
+			width = self.sceneSize
+		with self.lock, self.engine.profiler.phase("wound"):
+			hit = wound_mask(self.scenePositions(), self.geometry, self.area, self.angles, center, width)
+			self.takeOut(hit)
+		self.publish()
+		self.present(graphicsScene)
+		return hit
+
+	def syncItems(self, graphicsScene):
+		# one shown item per view row, the view gets replaced wholesale on every present
+		if self.hidden:
+			return
+		if self.batched:
+			self.population.update()
+			return
+		from cell import CellGraphicsItem as Cell
+		n = len(self.view)
+		while len(self.cells) < n:
+			self.cells.append(Cell(self.view, len(self.cells), self.sceneScale))
+		for cell in self.cells[self.shown:n]:
+			cell.setPos(cell.X(), cell.Y())
+			graphicsScene.addItem(cell)
+		for cell in self.cells[n:self.shown]:
+			graphicsScene.removeItem(cell)
+		self.shown = n
 
 	def getCells(self):
 		return self.visible_cells
@@ -136,41 +358,9 @@ class SceneState():
 		self.cell_coords = [[c.X(), c.Y()] for c in self.visible_cells]
 
 	def averagePosition(self):
-		x, y = 0, 0
-		for c in self.visible_cells:
-			x += c.X()
-			y += c.Y()
-
-		x /= len(self.visible_cells)
-		y /= len(self.visible_cells)
-
-		return np.array([x, y])
+		with self.lock:
+			return self.engine.aggregates().avpos
 
 	def averageVelocity(self):
-		dx, dy = 0, 0
-		for c in self.visible_cells:
-			vx, vy = c.vel()
-			dx += vx
-			dy += vy
-
-		dx /= len(self.visible_cells)
-		dy /= len(self.visible_cells)
-		return np.array([dx, dy])
-
-	def updatePositions(self):
-		avpos = self.averagePosition()
-		avvel = self.averageVelocity()
-
-		pos_difs = list()
-		pos_comps = list()
-		
-		for cell in self.visuble_cells:
-			cell.new_pos(self.visible_cells, avpos, avvel, len(self.visible_cells))
-
-	
-
-
-
-
-
-
+		with self.lock:
+			return self.engine.aggregates().avvel
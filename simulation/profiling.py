@@ -0,0 +1,91 @@
+import collections
+import csv
+import itertools
+import threading
+import time
+
+# timed phases and counted quantities, one column each in the exported rows
+PHASES = ("neighbor", "force", "motility", "division", "wound", "paint")
+COUNTERS = ("cells", "pairs", "divisions")
+
+class NullPhase():
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		return False
+
+NULL_PHASE = NullPhase()
+
+class Phase():
+	def __init__(self, profiler, name):
+		self.profiler = profiler
+		self.name = name
+
+	def __enter__(self):
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		self.profiler.current[self.name] += time.perf_counter() - self.start
+		return False
+
+class Profiler():
+	# phase timers and counters gathered into one row per model step; while disabled phase()
+	# hands back a shared no-op and count() returns straight away, so nothing is recorded. With
+	# keep only the last keep rows are held, a run that goes on for hours stays bounded. The
+	# stepping thread appends rows while the dialog reads them, so rows is only touched under lock.
+	def __init__(self, enabled=False, keep=None):
+		self.enabled = enabled
+		self.lock = threading.Lock()
+		self.rows = collections.deque(maxlen=keep)
+		self.current = self.blank(0)
+
+	def blank(self, step):
+		row = {"step": step}
+		row.update(dict.fromkeys(PHASES, 0.0))
+		row.update(dict.fromkeys(COUNTERS, 0))
+		return row
+
+	def enable(self, enabled):
+		self.enabled = enabled
+		self.current = self.blank(self.current["step"])
+
+	def phase(self, name):
+		if not self.enabled:
+			return NULL_PHASE
+		return Phase(self, name)
+
+	def count(self, name, value):
+		if self.enabled:
+			self.current[name] += value
+
+	def end_step(self, step):
+		# close the open row under this step number, whatever gets timed next goes in a new one
+		if not self.enabled:
+			return
+		self.current["step"] = step
+		with self.lock:
+			self.rows.append(self.current)
+		self.current = self.blank(step)
+
+	def clear(self):
+		with self.lock:
+			self.rows.clear()
+		self.current = self.blank(self.current["step"])
+
+	def recent(self, last=30):
+		# mean of each column over the last few closed rows
+		with self.lock:
+			rows = list(itertools.islice(reversed(self.rows), last))
+		if not rows:
+			return None
+		return dict((name, sum(row[name] for row in rows) / len(rows)) for name in PHASES + COUNTERS)
+
+	def to_csv(self, path):
+		with self.lock:
+			rows = list(self.rows)
+		with open(path, "w", newline="") as f:
+			writer = csv.DictWriter(f, fieldnames=("step",) + PHASES + COUNTERS)
+			writer.writeheader()
+			writer.writerows(rows)
@@ -0,0 +1,274 @@
+import math
+import numpy as np
+from PyQt5.QtCore import Qt, QPointF, QRectF
+from PyQt5.QtWidgets import QGraphicsItem
+from PyQt5.QtGui import QColor, QImage, QPainterPath, QPen, QPolygonF
+from wound import polygon_vertices, SCENE_SIZE
+
+# canvas padding so shapes hanging over the edge never need clipping
+MARGIN = 16
+# what the population item covers: the scene, plus MARGIN for the cells at its far edges, which
+# are drawn from their corner
+SCENE_RECT = QRectF(0, 0, SCENE_SIZE + MARGIN, SCENE_SIZE + MARGIN)
+
+# level of detail: "auto" draws the density heatmap above HEATMAP_CELLS cells or when the view
+# is zoomed out below HEATMAP_ZOOM, and draws the cells over it where at most OVERLAY_CELLS of
+# them are in view
+DETAILS = ("auto", "cells", "heatmap")
+HEATMAP_CELLS = 20000
+HEATMAP_ZOOM = 0.5
+OVERLAY_CELLS = 2000
+# zoomed in, up to this many ellipses are drawn one by one as shapes, more go through a raster at
+# the view's resolution; each drawEllipse costs about 0.1 ms
+VECTOR_CELLS = 50
+
+def polygonF(points):
+	# QPolygonF filled straight from an (n, 2) array through its point buffer
+	points = np.ascontiguousarray(points, dtype=np.float64)
+	poly = QPolygonF(len(points))
+	if len(points):
+		ptr = poly.data()
+		ptr.setsize(points.nbytes)
+		np.frombuffer(ptr, dtype=np.float64).reshape(-1, 2)[:] = points
+	return poly
+
+# the dialog's styling, shared with the offscreen export
+BACKGROUND_COLOR = QColor(38, 44, 105)
+CELL_COLOR = QColor(209, 220, 237)
+WOUND_COLOR = QColor(252, 236, 0)
+WOUND_WIDTH = 3
+
+def wound_path(geometry, area, angles, size):
+	# outline of the wound cut in the middle of a size x size scene
+	c = size / 2
+	path = QPainterPath()
+	if geometry == "line":
+		path.addRect(0, c - area / 2, size, area)
+	elif geometry == "poly":
+		poly = QPolygonF()
+		for px, py in polygon_vertices(area, angles, (c, c)):
+			poly.append(QPointF(px, py))
+		path.addPolygon(poly)
+		path.closeSubpath()
+	elif geometry == "circle":
+		r = math.sqrt(area / math.pi)
+		path.addEllipse(c - r, c - r, 2 * r, 2 * r)
+	return path
+
+def argb(color):
+	return np.uint32(color.rgba())
+
+def hue_rgb(hue):
+	# fully saturated colors around the hue circle (0..1), packed as 0xRRGGBB
+	k = (np.array([5.0, 3.0, 1.0])[:, None] + 6 * hue) % 6
+	r, g, b = (255 * (1 - np.clip(np.minimum(k, 4 - k), 0, 1))).astype(np.uint32)
+	return (r << 16) | (g << 8) | b
+
+def density_image(pos, vel, width, height, size, color, direction=False):
+	# 2d histogram of the positions in size x size bins as ARGB pixels: opacity grows with the log
+	# of the count, the color is the cells' color or the hue of the bin's mean velocity direction
+	nx, ny = int(np.ceil(width / size)), int(np.ceil(height / size))
+	b = (pos // size).astype(np.intp)
+	key = np.clip(b[:, 1], 0, ny - 1) * nx + np.clip(b[:, 0], 0, nx - 1)
+	counts = np.bincount(key, minlength=nx * ny)
+	level = np.log1p(counts) / np.log1p(max(counts.max(), 1)) if len(pos) else counts
+	alpha = (255 * level).astype(np.uint32) << 24
+	if direction:
+		vx = np.bincount(key, weights=vel[:, 0], minlength=nx * ny)
+		vy = np.bincount(key, weights=vel[:, 1], minlength=nx * ny)
+		# bins that on average stand still keep the cells' color
+		still = np.hypot(vx, vy) < 0.1 * np.maximum(counts, 1)
+		rgb = np.where(still, argb(color) & np.uint32(0xFFFFFF), hue_rgb((np.arctan2(vy, vx) / (2 * np.pi)) % 1))
+	else:
+		rgb = argb(color) & np.uint32(0xFFFFFF)
+	return (alpha | rgb).reshape(ny, nx)
+
+def cell_shapes(pos, vel, radius, motile):
+	# CellGraphicsItem.paint's shape choice for every cell at once: ellipse sizes for the slow and
+	# nonmotile cells, triangle vertices pointing along the velocity for the fast ones
+	vx, vy = np.abs(vel[:, 0]), np.abs(vel[:, 1])
+	still = ~motile | ((vel[:, 0] < 0.1) & (vy < 0.1))
+	grow = np.where(still, 0, np.where((vx < 0.3) & (vy < 0.3), 1, np.where((vx < 0.5) & (vy < 0.5), 2, -1)))
+	w = radius + np.where(vx > vy, grow, 0)
+	h = radius + np.where(vx > vy, 0, grow)
+	ellipse = grow >= 0
+
+	fast = np.flatnonzero(~ellipse)
+	p1 = pos[fast]
+	speed = np.linalg.norm(vel[fast], axis=1)
+	u = vel[fast] / np.where(speed > 0, speed, 1.0)[:, None]
+	p2 = p1 - radius[fast, None] * u
+	normal = np.stack((-u[:, 1], u[:, 0]), axis=1) * (radius[fast] // 2)[:, None]
+	tris = np.stack((p1, p2 - normal, p2 + normal), axis=1)
+	return np.flatnonzero(ellipse), w, h, tris
+
+def ellipse_rows(w, h):
+	# horizontal spans (dy, x0, x1) of a w x h ellipse, relative to its center pixel
+	dy = np.arange(-(h // 2), h - h // 2)
+	t = (dy + 0.5 - (h % 2) * 0.5) / (h / 2.0)
+	half = (w / 2.0) * np.sqrt(np.clip(1 - t * t, 0, None))
+	x0 = np.rint(-half).astype(np.intp)
+	x1 = np.rint(half).astype(np.intp)
+	keep = x1 > x0
+	return dy[keep], x0[keep], x1[keep]
+
+def ellipse_coverage(center, w, h, width, height):
+	# pixels covered by any ellipse: every span adds +1 at its start and -1 at its end, one
+	# bincount per side and a running sum along the rows turns that into coverage; the padding
+	# grows with the largest ellipse so cells clamped into it never reach the image
+	margin = max(MARGIN, 2 * (int(max(w.max(), h.max())) // 2 + 1))
+	stride = width + 2 * margin + 1
+	rows = height + 2 * margin
+	c = np.rint(center).astype(np.intp)
+	c[:, 0] = np.clip(c[:, 0], -margin // 2, width + margin // 2) + margin
+	c[:, 1] = np.clip(c[:, 1], -margin // 2, height + margin // 2) + margin
+	base = c[:, 1] * stride + c[:, 0]
+
+	# cells sharing an ellipse size share one span table
+	key = w.astype(np.intp) * 4096 + h.astype(np.intp)
+	order = np.argsort(key, kind="stable")
+	sizes, first = np.unique(key[order], return_index=True)
+	bounds = np.append(first, len(order))
+	starts, ends = list(), list()
+	for g, size in enumerate(sizes):
+		dy, x0, x1 = ellipse_rows(size // 4096, size % 4096)
+		b = base[order[bounds[g]:bounds[g + 1]]]
+		starts.append(np.add.outer(b, dy * stride + x0).ravel())
+		ends.append(np.add.outer(b, dy * stride + x1).ravel())
+	n = rows * stride
+	diff = np.bincount(np.concatenate(starts), minlength=n) - np.bincount(np.concatenate(ends), minlength=n)
+	cover = np.cumsum(diff.reshape(rows, stride), axis=1) > 0
+	return cover[margin:margin + height, margin:margin + width]
+
+def outline_of(fill):
+	# one pixel ring around the filled area, the black pen drawEllipse used to leave
+	grown = fill.copy()
+	grown[1:] |= fill[:-1]
+	grown[:-1] |= fill[1:]
+	grown[:, 1:] |= fill[:, :-1]
+	grown[:, :-1] |= fill[:, 1:]
+	return grown & ~fill
+
+def triangle_strip(tris):
+	# triangles as one polygon: each triangle is closed on its apex and the apexes are
+	# walked back at the end, so the connecting edges cancel out under winding fill
+	if len(tris) == 0:
+		return np.zeros((0, 2))
+	loops = np.concatenate((tris, tris[:, :1]), axis=1).reshape(-1, 2)
+	return np.concatenate((loops, tris[::-1, 0]))
+
+def triangle_batches(tris, size=64, tile=16):
+	# the rasterizer pays for the connecting edges, so neighbors go in the same short strip
+	order = np.lexsort((tris[:, 0, 0] // tile, tris[:, 0, 1] // tile))
+	tris = tris[order]
+	return [triangle_strip(tris[k:k + size]) for k in range(0, len(tris), size)]
+
+class PopulationGraphicsItem(QGraphicsItem):
+	# one scene item that paints every cell of an engine per paint() call: the ellipses are
+	# rasterized into one image from the engine arrays, the rare triangles go in a few polygons.
+	# Large or zoomed out populations are drawn as a density heatmap instead.
+	def __init__(self, engine, rect, sceneScale=1.0, parent=None):
+		super(PopulationGraphicsItem, self).__init__(parent)
+		self.engine = engine
+		self.rect = QRectF(rect)
+		# scene units per engine unit
+		self.sceneScale = sceneScale
+		self.cellColor = QColor(CELL_COLOR)
+		self.outline = QColor(0, 0, 0)
+		self.buffer = None
+		self.detail = "auto"
+		# heatmap bin side in scene units, and whether bins take the hue of their mean velocity
+		self.binSize = 4.0
+		self.direction = False
+		self.heat = None
+		# exposedRect in paint() is then the part of the item the view shows
+		self.setFlag(QGraphicsItem.ItemUsesExtendedStyleOption)
+
+	def boundingRect(self):
+		return self.rect
+
+	def advance(self, step):
+		if (step == 0):
+			return
+		self.update()
+
+	def positions(self):
+		# same spot CellGraphicsItem draws at
+		alive = self.engine.active
+		if self.engine.num_active() == len(self.engine):
+			alive = slice(None)
+		return self.sceneScale * self.engine.pos[alive], self.engine.vel[alive], self.engine.radius[alive], self.engine.motile[alive]
+
+	def cellImage(self, center, w, h, area, scale=1.0):
+		# area of the item rasterized at scale pixels per scene unit, returns the image and the
+		# rect it covers
+		width, height = int(math.ceil(area.width() * scale)), int(math.ceil(area.height() * scale))
+		origin = np.array([area.left(), area.top()])
+		fill = ellipse_coverage((center - origin) * scale, np.rint(w * scale), np.rint(h * scale), width, height)
+		# the image shares this buffer, so it has to outlive the paint call
+		self.buffer = np.zeros((height, width), dtype=np.uint32)
+		self.buffer[outline_of(fill)] = argb(self.outline)
+		self.buffer[fill] = argb(self.cellColor)
+		image = QImage(self.buffer.data, width, height, 4 * width, QImage.Format_ARGB32)
+		return image, QRectF(area.left(), area.top(), width / scale, height / scale)
+
+	def heatmapImage(self, pos, vel):
+		origin = np.array([self.rect.left(), self.rect.top()])
+		# kept like buffer, the image reads it when drawn
+		self.heat = density_image(pos - origin, vel, self.rect.width(), self.rect.height(),
+			self.binSize, self.cellColor, self.direction)
+		h, w = self.heat.shape
+		return QImage(self.heat.data, w, h, 4 * w, QImage.Format_ARGB32)
+
+	def useHeatmap(self, n, zoom):
+		if self.detail != "auto":
+			return self.detail == "heatmap"
+		return n > HEATMAP_CELLS or zoom < HEATMAP_ZOOM
+
+	def paint(self, painter, graphitem, widget):
+		with self.engine.profiler.phase("paint"):
+			self.paintCells(painter, graphitem)
+
+	def paintCells(self, painter, graphitem=None):
+		pos, vel, radius, motile = self.positions()
+		zoom = 1.0
+		if graphitem is not None:
+			zoom = graphitem.levelOfDetailFromTransform(painter.worldTransform())
+		if not self.useHeatmap(len(pos), zoom):
+			if zoom > 1:
+				self.paintExposed(painter, graphitem.exposedRect, zoom, pos, vel, radius, motile)
+			else:
+				self.paintShapes(painter, pos, vel, radius, motile)
+			return
+		painter.drawImage(self.rect, self.heatmapImage(pos, vel))
+		if graphitem is None or self.detail == "heatmap" or zoom < HEATMAP_ZOOM:
+			return
+		# zoomed in far enough that few cells are in view: those are drawn individually on top
+		self.paintExposed(painter, graphitem.exposedRect, zoom, pos, vel, radius, motile, OVERLAY_CELLS)
+
+	def paintExposed(self, painter, shown, zoom, pos, vel, radius, motile, limit=None):
+		# only the cells in the part of the item the view shows, at the view's resolution
+		inside = np.flatnonzero((pos[:, 0] >= shown.left() - MARGIN) & (pos[:, 0] <= shown.right())
+			& (pos[:, 1] >= shown.top() - MARGIN) & (pos[:, 1] <= shown.bottom()))
+		if limit is None or len(inside) <= limit:
+			self.paintShapes(painter, pos[inside], vel[inside], radius[inside], motile[inside], shown, max(zoom, 1.0))
+
+	def paintShapes(self, painter, pos, vel, radius, motile, shown=None, zoom=1.0):
+		ellipses, w, h, tris = cell_shapes(pos, vel, radius, motile)
+		w, h = w[ellipses], h[ellipses]
+		if zoom > 1 and len(ellipses) <= VECTOR_CELLS:
+			# a few cells seen up close are drawn as shapes, a raster would show its pixels
+			painter.setPen(QPen(self.outline, 0))
+			painter.setBrush(self.cellColor)
+			for (x, y), a, b in zip(pos[ellipses], w, h):
+				painter.drawEllipse(QRectF(x, y, a, b))
+		elif len(ellipses):
+			# drawEllipse(x, y, w, h) puts the ellipse's corner at the cell position
+			center = pos[ellipses] + np.stack((w, h), axis=1) / 2.0
+			image, target = self.cellImage(center, w, h, self.rect if shown is None else shown, zoom)
+			painter.drawImage(target, image)
+
+		painter.setPen(Qt.NoPen)
+		painter.setBrush(self.cellColor)
+		for strip in triangle_batches(tris):
+			painter.drawPolygon(polygonF(strip), Qt.WindingFill)
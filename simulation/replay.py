@@ -0,0 +1,58 @@
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from trajectory import Trajectory
+
+class TrajectoryPlayer():
+	# playback cursor over a recorded trajectory, frames are read ahead on a background thread
+	def __init__(self, path, ahead=16):
+		self.trajectory = Trajectory(path)
+		self.ahead = ahead
+		self.position = 0.0
+		self.speed = 1.0
+		self.pending = dict()
+		self.pool = ThreadPoolExecutor(max_workers=1)
+
+	def __len__(self):
+		return len(self.trajectory)
+
+	def load(self, k):
+		# copying out of the memory map pages the frame in off the GUI thread
+		return np.array(self.trajectory.frame(k))
+
+	def upcoming(self):
+		k = int(self.position)
+		return sorted(set(min(k + int(m * self.speed), len(self) - 1) for m in range(self.ahead)))
+
+	def prefetch(self):
+		wanted = self.upcoming()
+		for k in list(self.pending):
+			if k not in wanted:
+				self.pending.pop(k).cancel()
+		for k in wanted:
+			if k not in self.pending:
+				self.pending[k] = self.pool.submit(self.load, k)
+
+	def seek(self, k):
+		self.position = float(min(max(k, 0), len(self) - 1))
+		self.prefetch()
+
+	def setSpeed(self, speed):
+		self.speed = speed
+		self.prefetch()
+
+	def atEnd(self):
+		return int(self.position) >= len(self) - 1
+
+	def current(self):
+		# index, step number and frame under the cursor
+		k = int(self.position)
+		self.prefetch()
+		return k, int(self.trajectory.steps[k]), self.pending[k].result()
+
+	def advance(self):
+		self.position = min(self.position + self.speed, len(self) - 1)
+		return self.current()
+
+	def close(self):
+		self.pending.clear()
+		self.pool.shutdown(wait=False)
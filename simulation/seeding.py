@@ -0,0 +1,115 @@
+import math
+import numpy as np
+from spatial import CellGrid
+
+SEEDINGS = ("random", "poisson", "hex", "confluent")
+
+# area fraction Poisson disk seeding aims for, random sequential adsorption jams near 0.547
+POISSON_COVERAGE = 0.4
+
+def uniform(rng, n, bounds):
+	return rng.random((n, 2)) * bounds
+
+# background grid neighbors that can hold a point closer than the spacing, on cells of side
+# spacing/sqrt(2); the corners two cells away are exactly one spacing off
+DISK_SHELL = tuple((dx, dy) for dx in range(-2, 3) for dy in range(-2, 3)
+	if (dx, dy) != (0, 0) and abs(dx) + abs(dy) < 4)
+
+def poisson_disk(rng, n, bounds, spacing=None, rounds=32):
+	# n points at least spacing apart by parallel dart throwing on a background grid that holds at
+	# most one point per cell: every round throws one dart into each empty cell, one of nine
+	# interleaved cell classes at a time, and darts of one class are three cells apart so they
+	# only have to be checked against the points already placed
+	if spacing is None:
+		spacing = 2 * math.sqrt(POISSON_COVERAGE * bounds * bounds / (math.pi * max(n, 1)))
+	side = spacing / math.sqrt(2)
+	nx = int(math.ceil(bounds / side))
+	held = np.zeros((nx + 4, nx + 4), dtype=bool)
+	points = np.full((nx + 4, nx + 4, 2), np.nan)
+	classes = list()
+	for ox in range(3):
+		for oy in range(3):
+			cx, cy = np.meshgrid(np.arange(ox, nx, 3), np.arange(oy, nx, 3), indexing="ij")
+			classes.append((cx.ravel() + 2, cy.ravel() + 2))
+	count = 0
+	for _ in range(rounds):
+		for cx, cy in classes:
+			free = ~held[cx, cy]
+			x, y = cx[free], cy[free]
+			dart = (np.stack((x, y), axis=1) - 2 + rng.random((len(x), 2))) * side
+			ok = (dart[:, 0] < bounds) & (dart[:, 1] < bounds)
+			for dx, dy in DISK_SHELL:
+				near = points[x + dx, y + dy]
+				d = dart - near
+				# nan for empty cells compares false
+				ok &= ~(np.einsum('ij,ij->i', d, d) < spacing * spacing)
+			held[x[ok], y[ok]] = True
+			points[x[ok], y[ok]] = dart[ok]
+			count += int(np.count_nonzero(ok))
+		if count >= n:
+			break
+	placed = points[held]
+	if len(placed) < n:
+		# saturated before reaching n, try again a little closer
+		return poisson_disk(rng, n, bounds, 0.9 * spacing, rounds)
+	return placed[np.sort(rng.choice(len(placed), n, replace=False))]
+
+def hex_spacing(n, bounds):
+	# side of the triangular lattice putting n points in the box, each point owns sqrt(3)/2 a^2
+	return math.sqrt(2 * bounds * bounds / (math.sqrt(3) * max(n, 1)))
+
+def hex_lattice(rng, n, bounds, jitter=0.0):
+	# triangular lattice at the density of n points in the box, at a random offset; whole rows
+	# never fit exactly, so the lattice is built a little dense and random sites are left empty
+	a = hex_spacing(n, bounds)
+	while True:
+		h = a * math.sqrt(3) / 2
+		ox, oy = rng.random(2) * (a, h)
+		rows = np.arange(oy, bounds, h)
+		cols = np.arange(ox, bounds, a)
+		x = cols[None, :] + (np.arange(len(rows)) % 2)[:, None] * (a / 2)
+		y = np.broadcast_to(rows[:, None], x.shape)
+		points = np.stack((x.ravel(), y.ravel()), axis=1)
+		points = points[points[:, 0] < bounds]
+		if len(points) >= n:
+			break
+		a *= 0.99
+	points = points[np.sort(rng.choice(len(points), n, replace=False))]
+	if jitter:
+		points = np.clip(points + (rng.random(points.shape) - 0.5) * jitter * a, 0, bounds)
+	return points
+
+def relax(pos, spacing, bounds, iterations=6, step=0.8):
+	# soft repulsion between points closer than spacing, each overlapping pair is pushed apart by
+	# a share of its overlap; removes the close pairs without the r1r2 spike at d -> 1
+	grid = CellGrid(spacing)
+	for _ in range(iterations):
+		grid.build(pos)
+		i, j = grid.half_pairs(spacing)
+		r = pos[i] - pos[j]
+		d = np.sqrt(np.einsum('ij,ij->i', r, r))
+		push = r * (step * (spacing - d) / (2 * np.where(d > 0, d, 1.0)))[:, None]
+		move = np.zeros_like(pos)
+		for axis in (0, 1):
+			move[:, axis] = np.bincount(i, weights=push[:, axis], minlength=len(pos))
+			move[:, axis] -= np.bincount(j, weights=push[:, axis], minlength=len(pos))
+		pos = np.clip(pos + move, 0, bounds)
+	return pos
+
+def confluent_sheet(rng, n, bounds, iterations=6):
+	# the box filled edge to edge: a strongly jittered lattice relaxed into a disordered sheet
+	# with no pair much closer than the lattice spacing
+	a = hex_spacing(n, bounds)
+	return relax(hex_lattice(rng, n, bounds, jitter=0.8), 0.9 * a, bounds, iterations)
+
+def place(rng, n, bounds, method="random"):
+	# positions of n new cells in a bounds x bounds box
+	if method == "random":
+		return uniform(rng, n, bounds)
+	elif method == "poisson":
+		return poisson_disk(rng, n, bounds)
+	elif method == "hex":
+		return hex_lattice(rng, n, bounds)
+	elif method == "confluent":
+		return confluent_sheet(rng, n, bounds)
+	raise ValueError("unknown seeding {0}".format(method))
@@ -1,29 +1,45 @@
 import numpy as np
 import math
-from fbs_runtime.application_context.PyQt5 import ApplicationContext
 from PyQt5.QtCore import QDateTime, Qt, QTimer, QPoint, QRect, QPropertyAnimation, QParallelAnimationGroup
 from PyQt5.QtWidgets import (QApplication, QCheckBox, QComboBox, QDateTimeEdit,
         QDial, QDialog, QGridLayout, QGroupBox, QHBoxLayout, QLabel, QLineEdit,
         QProgressBar, QPushButton, QRadioButton, QScrollBar, QSizePolicy,
         QSlider, QSpinBox, QStyleFactory, QTableWidget, QTabWidget, QTextEdit,
-        QVBoxLayout, QWidget, QGraphicsScene, QGraphicsView)
+        QVBoxLayout, QWidget, QGraphicsScene, QGraphicsView, QFileDialog, QMessageBox)
 from PyQt5.QtGui import QDoubleValidator, QColor, QPen, QPainter, QBrush, QPolygonF
-import pyqtgraph as pg 
 import sys
 from graphicsview import SceneState
-from time import sleep
-from tqdm import tqdm
+from engine import BOUNDARIES
+from seeding import SEEDINGS
+from replay import TrajectoryPlayer
+from trajectory import load_frame
+from worker import SimulationWorker
+from export import render
+from profiling import PHASES, COUNTERS
+from renderer import DETAILS, BACKGROUND_COLOR, CELL_COLOR, WOUND_COLOR, WOUND_WIDTH, wound_path
+
+# cells of a new or reset simulation
+INITIAL_CELLS = 2500
+# where closing the dialog leaves the running simulation, Load Checkpoint picks it up again
+AUTOSAVE = "autosave.ckpt.npz"
+
+class ZoomGraphicsView(QGraphicsView):
+	# the mouse wheel zooms in and out around the cursor
+	def wheelEvent(self, event):
+		factor = 1.25 if event.angleDelta().y() > 0 else 0.8
+		self.setTransformationAnchor(QGraphicsView.AnchorUnderMouse)
+		self.scale(factor, factor)
 
 class MenuController(QDialog):
 	def __init__(self, parent=None):
 		super(MenuController, self).__init__(parent)
 
 		self.c = 0
-		self.backgroundColor = QColor(38, 44, 105)
-		self.cellColor = QColor(209, 220, 237)
-		self.woundColor = QColor(252, 236, 0)
+		self.backgroundColor = QColor(BACKGROUND_COLOR)
+		self.cellColor = QColor(CELL_COLOR)
+		self.woundColor = QColor(WOUND_COLOR)
 		self.woundPen = QPen(self.woundColor)
-		self.woundPen.setWidth(3)
+		self.woundPen.setWidth(WOUND_WIDTH)
 		self.foregroundBrush = QBrush()
 		self.woundGraphics = None
 
@@ -39,15 +55,67 @@ class MenuController(QDialog):
 		self.createWoundControlBox()
 		self.createSimulationControlBox()
 		self.createGraphicsDisplay()
+		self.createReplayControlBox()
+		self.createProfilingBox()
 
 		mainLayout = QGridLayout()
-		mainLayout.addWidget(self.graphicsDisplayBox, 0, 0, 2, 10)
+		mainLayout.addWidget(self.graphicsDisplayBox, 0, 0, 4, 10)
 		mainLayout.addWidget(self.woundControlBox, 0, 11)
 		mainLayout.addWidget(self.simulationControlBox, 1, 11)
+		mainLayout.addWidget(self.replayControlBox, 2, 11)
+		mainLayout.addWidget(self.profilingBox, 3, 11)
 		self.setLayout(mainLayout)
 
 		self.setWindowTitle("WoundSimulation")
 		self.simRunning = False
+		self.player = None
+		self.replayState = None
+		self.replayTimer = QTimer(self)
+		self.replayTimer.timeout.connect(self.replayStep)
+		# the model steps on the worker, this timer only draws what it published last
+		self.worker = None
+		self.timer = QTimer(self)
+		self.timer.timeout.connect(self.renderFrame)
+
+	def resetSimulation(self):
+		self.pauseSim()
+		self.setWoundFalse()
+		self.sceneState.reset(INITIAL_CELLS, self.graphicsScene)
+
+	def saveCheckpoint(self):
+		path, _ = QFileDialog.getSaveFileName(self, "Save Checkpoint", "simulation.ckpt.npz", "Checkpoint (*.npz)")
+		if path:
+			self.sceneState.saveCheckpoint(path)
+
+	def loadCheckpoint(self):
+		path, _ = QFileDialog.getOpenFileName(self, "Load Checkpoint", "", "Checkpoint (*.npz)")
+		if not path:
+			return
+		self.pauseSim()
+		self.exitReplay()
+		try:
+			self.sceneState.loadCheckpoint(path, self.graphicsScene)
+		except ValueError as e:
+			QMessageBox.warning(self, "Load Checkpoint", str(e))
+			return
+		if(self.woundGraphics):
+			self.graphicsScene.removeItem(self.woundGraphics)
+			self.woundGraphics = None
+		self.r1coeffedit.setText("{0:g}".format(self.sceneState.r1coeff))
+		self.r2coeffedit.setText("{0:g}".format(self.sceneState.r2coeff))
+		self.r3coeffedit.setText("{0:g}".format(self.sceneState.r3coeff))
+		self.boundsEdit.setText("{0:g}".format(self.sceneState.getBounds()))
+		if self.sceneState.getIsWound():
+			# the saved cells already have the wound cut out, only its outline is drawn
+			self.showWoundOutline()
+
+	def showWoundOutline(self):
+		geo = self.sceneState.getGeometry()
+		area = self.sceneState.getArea()
+		angles = self.sceneState.getAngles()
+		size = self.sceneState.sceneSize
+		self.foregroundBrush.setColor(self.woundColor)
+		self.woundGraphics = self.graphicsScene.addPath(wound_path(geo, area, angles, size), self.woundPen)
 
 	def setWoundTrue(self):
 		self.sceneState.setWound(True)
@@ -58,15 +126,10 @@ class MenuController(QDialog):
 			self.graphicsScene.removeItem(self.woundGraphics)
 			self.woundGraphics = None
 
-			for c in self.sceneState.visible_cells:
-				self.sceneState.removeCellGraphics(c, self.graphicsScene)
-
 			self.foregroundBrush.setColor(self.cellColor)
 			self.foregroundBrush.setStyle(Qt.SolidPattern)
 
-			for c in self.sceneState.cells:
-				self.sceneState.addCellGraphics(c, self.graphicsScene)
-			self.sceneState.update_cell_info()
+			self.sceneState.restoreCells(self.graphicsScene)
 		self.sceneState.setWound(False)
 
 	def toggleArea(self):
@@ -93,13 +156,10 @@ class MenuController(QDialog):
 			self.removeCellGraphics(c)
 
 	def cleanupCells(self):
-		for cell in self.sceneState.cells:
-			if cell.collidesWithItem(self.woundGraphics):
-				self.sceneState.removeCellGraphics(cell, self.graphicsScene)
+		self.sceneState.cutWound(self.graphicsScene)
 	
 	def clearSceneOfGraphics(self):
-		for cell in self.sceneState.visible_cells:
-			self.sceneState.removeCellGraphics(cell, self.graphicsScene)
+		self.sceneState.removeCells(slice(None), self.graphicsScene)
 
 		self.graphicsScene.removeItem(self.woundGraphics)
 		self.woundGraphics = None
@@ -109,38 +169,14 @@ class MenuController(QDialog):
 		self.foregroundBrush.setStyle(Qt.SolidPattern)
 
 	def drawWound(self):
-		print("DRAWING WOUND\n")
 		if(self.woundGraphics):
 			self.graphicsScene.removeItem(self.woundGraphics)
 			self.woundGraphics = None
 
-		for cell in self.sceneState.visible_cells:
-			self.sceneState.removeCellGraphics(cell, self.graphicsScene)
-
 		self.setPenToCells()
-		
-		for cell in self.sceneState.cells:
-			self.sceneState.addCellGraphics(cell, self.graphicsScene)
-
-		geo = self.sceneState.getGeometry()
-		area = self.sceneState.getArea()
-		angles = self.sceneState.getAngles()
-		self.foregroundBrush.setColor(self.woundColor)
-		
-		if(geo == "line"):
-			self.woundGraphics = self.graphicsScene.addRect(0, 256 - area/2, 512, area, self.woundPen)
-		elif(geo == "poly"):
-			r = math.sqrt(area / (math.pi))
-			poly = QPolygonF()
-			for i in range(1, angles + 1):
-				px, py = (r * math.cos(2 * math.pi * i / angles), r * math.sin(2 * math.pi * i / angles))
-				p = QPoint(px + 256, py + 256)
-				poly.append(p)
-			self.woundGraphics = self.graphicsScene.addPolygon(poly, self.woundPen)
-		elif(geo == "circle"):
-			r = math.sqrt(area / (math.pi))
-			self.woundGraphics = self.graphicsScene.addEllipse(256 - (r/2), 256 - (r/2), r, r, self.woundPen)
+		self.sceneState.restoreCells(self.graphicsScene)
 
+		self.showWoundOutline()
 		self.cleanupCells()
 
 
@@ -218,13 +254,33 @@ class MenuController(QDialog):
 		self.sceneState.setTimeFactor(10.0)
 
 	def startSim(self):
+		self.exitReplay()
 		self.simRunning = True
 		self.runSimulation()
 
 	def pauseSim(self):
-		print("Pausing sim\n")
+		self.simRunning = False
+		if self.worker:
+			self.worker.pause()
 		self.timer.stop()
 
+	def setBatchedRendering(self, batched):
+		self.sceneState.setBatched(batched, self.graphicsScene)
+		if self.replayState:
+			self.sceneState.hideItems(self.graphicsScene)
+			self.replayState.setBatched(batched, self.graphicsScene)
+			self.replayState.syncItems(self.graphicsScene)
+
+	def changeDetail(self, detail):
+		self.sceneState.setDetail(detail)
+		if self.replayState:
+			self.replayState.setDetail(detail)
+
+	def setVelocityDirection(self, direction):
+		self.sceneState.setDirection(direction)
+		if self.replayState:
+			self.replayState.setDirection(direction)
+
 	def changeR1Coeff(self):
 		self.sceneState.setR1(float(self.r1coeffedit.text()))
 
@@ -234,6 +290,20 @@ class MenuController(QDialog):
 	def changeR3Coeff(self):
 		self.sceneState.setR3(float(self.r3coeffedit.text()))
 
+	def changeBounds(self):
+		self.sceneState.setBounds(float(self.boundsEdit.text()), self.graphicsScene)
+
+	def changeBoundary(self, boundary):
+		self.sceneState.setBoundary(boundary)
+
+	def changeSeeding(self, seeding):
+		# lay the same number of cells out again the new way
+		self.sceneState.setSeeding(seeding)
+		n = self.sceneState.engine.num_active()
+		self.sceneState.removeCells(slice(None), self.graphicsScene)
+		self.sceneState.compact()
+		self.add_cells(n)
+
 	def createSimulationControlBox(self):
 		self.simulationControlBox = QGroupBox("Simulation")
 
@@ -273,6 +343,24 @@ class MenuController(QDialog):
 		self.r2coeffedit.editingFinished.connect(self.changeR2Coeff)
 		self.r3coeffedit.editingFinished.connect(self.changeR3Coeff)
 
+		# domain side in engine units and what its edges do
+		self.boundsEdit = QLineEdit()
+		self.boundsEdit.setPlaceholderText("Domain Size ({0:g})".format(self.sceneState.getBounds()))
+		boundsValidator = QDoubleValidator()
+		boundsValidator.setBottom(64.0)
+		self.boundsEdit.setValidator(boundsValidator)
+		self.boundsEdit.editingFinished.connect(self.changeBounds)
+
+		boundaryComboBox = QComboBox()
+		boundaryComboBox.addItems(BOUNDARIES)
+		boundaryComboBox.setCurrentText(self.sceneState.getBoundary())
+		boundaryComboBox.currentTextChanged.connect(self.changeBoundary)
+
+		seedingComboBox = QComboBox()
+		seedingComboBox.addItems(SEEDINGS)
+		seedingComboBox.setCurrentText(self.sceneState.getSeeding())
+		seedingComboBox.currentTextChanged.connect(self.changeSeeding)
+
 		
 		#self.woundArea.editingFinished.connect(self.toggleArea)
 		
@@ -302,11 +390,34 @@ class MenuController(QDialog):
 		stopButton.clicked.connect(self.pauseSim)
 
 		resetButton = QPushButton("Reset Simulation")
+		resetButton.clicked.connect(self.resetSimulation)
+
+		saveButton = QPushButton("Save Checkpoint")
+		saveButton.clicked.connect(self.saveCheckpoint)
+
+		loadButton = QPushButton("Load Checkpoint")
+		loadButton.clicked.connect(self.loadCheckpoint)
+
+		self.batchBox = QCheckBox("Batched Rendering")
+		self.batchBox.setChecked(False)
+		self.batchBox.toggled.connect(self.setBatchedRendering)
+
+		detailComboBox = QComboBox()
+		detailComboBox.addItems(DETAILS)
+		detailComboBox.setCurrentText(self.sceneState.detail)
+		detailComboBox.currentTextChanged.connect(self.changeDetail)
+
+		directionBox = QCheckBox("Heatmap Velocity Direction")
+		directionBox.setChecked(False)
+		directionBox.toggled.connect(self.setVelocityDirection)
 
 		layout = QVBoxLayout()
 		layout.addWidget(self.r1coeffedit)
 		layout.addWidget(self.r2coeffedit)
 		layout.addWidget(self.r3coeffedit)
+		layout.addWidget(self.boundsEdit)
+		layout.addWidget(boundaryComboBox)
+		layout.addWidget(seedingComboBox)
 		layout.addWidget(radioButton1)
 		layout.addWidget(radioButton2)
 		layout.addWidget(radioButton3)
@@ -316,28 +427,175 @@ class MenuController(QDialog):
 		layout.addWidget(startButton)
 		layout.addWidget(stopButton)
 		layout.addWidget(resetButton)
+		layout.addWidget(saveButton)
+		layout.addWidget(loadButton)
+		layout.addWidget(self.batchBox)
+		layout.addWidget(detailComboBox)
+		layout.addWidget(directionBox)
 		self.simulationControlBox.setLayout(layout)
 
 
+	def createReplayControlBox(self):
+		self.replayControlBox = QGroupBox("Replay")
+
+		loadButton = QPushButton("Load Trajectory")
+		loadButton.clicked.connect(self.loadTrajectory)
+
+		playButton = QPushButton("Play")
+		playButton.clicked.connect(self.playReplay)
+
+		pauseButton = QPushButton("Pause")
+		pauseButton.clicked.connect(self.pauseReplay)
+
+		exitButton = QPushButton("Exit Replay")
+		exitButton.clicked.connect(self.exitReplay)
+
+		saveFrameButton = QPushButton("Save Frame")
+		saveFrameButton.clicked.connect(self.saveFrame)
+
+		self.replayLabel = QLabel("No trajectory loaded")
+
+		# scrub bar over the recorded frames
+		self.replaySlider = QSlider(Qt.Horizontal)
+		self.replaySlider.setMinimum(0)
+		self.replaySlider.setMaximum(0)
+		self.replaySlider.valueChanged.connect(self.seekReplay)
+
+		layout = QVBoxLayout()
+		layout.addWidget(loadButton)
+		layout.addWidget(self.replaySlider)
+		layout.addWidget(self.replayLabel)
+		layout.addWidget(playButton)
+		layout.addWidget(pauseButton)
+		layout.addWidget(exitButton)
+		layout.addWidget(saveFrameButton)
+		self.replayControlBox.setLayout(layout)
+
+	def saveFrame(self):
+		# the shown frame, live or replayed, rendered offscreen like export.py renders trajectories
+		path, _ = QFileDialog.getSaveFileName(self, "Save Frame", "frame.png", "PNG (*.png)")
+		if not path:
+			return
+		state = self.replayState or self.sceneState
+		wound = self.woundGraphics.path() if self.woundGraphics and not self.replayState else None
+		render(state.view, wound, bounds=state.getBounds()).save(path)
+
+	def loadTrajectory(self):
+		path = QFileDialog.getExistingDirectory(self, "Open Trajectory")
+		if not path:
+			return
+		if self.simRunning:
+			self.pauseSim()
+		self.exitReplay()
+
+		# the live cells leave the scene but keep their state for when replay ends
+		self.sceneState.hideItems(self.graphicsScene)
+		self.player = TrajectoryPlayer(path)
+		recorded = self.player.trajectory
+		self.replayState = SceneState(bounds=recorded.bounds, boundary=recorded.boundary)
+		self.replayState.setDetail(self.sceneState.detail)
+		self.replayState.setDirection(self.sceneState.direction)
+		self.replayState.setBatched(self.sceneState.batched, self.graphicsScene)
+		self.replaySlider.setMaximum(len(self.player) - 1)
+		self.seekReplay(0)
+
+	def showReplayFrame(self, k, step, frame):
+		load_frame(self.replayState.view, frame)
+		self.replayState.syncItems(self.graphicsScene)
+		self.graphicsScene.advance()
+		self.replaySlider.blockSignals(True)
+		self.replaySlider.setValue(k)
+		self.replaySlider.blockSignals(False)
+		self.replayLabel.setText("Step {0}, {1} cells".format(step, len(frame)))
+
+	def seekReplay(self, k):
+		if not self.player:
+			return
+		self.player.seek(k)
+		self.showReplayFrame(*self.player.current())
+
+	def playReplay(self):
+		if self.player:
+			self.replayTimer.start(int(1000/33))
+
+	def pauseReplay(self):
+		self.replayTimer.stop()
+
+	def replayStep(self):
+		# the speed radio buttons set how many recorded frames pass per tick
+		self.player.setSpeed(self.sceneState.getTimeFactor())
+		self.showReplayFrame(*self.player.advance())
+		if self.player.atEnd():
+			self.pauseReplay()
+
+	def exitReplay(self):
+		if not self.player:
+			return
+		self.pauseReplay()
+		self.replayState.hideItems(self.graphicsScene)
+		self.player.close()
+		self.player = None
+		self.replayState = None
+		self.replaySlider.setMaximum(0)
+		self.replayLabel.setText("No trajectory loaded")
+		self.sceneState.showItems(self.graphicsScene)
+
+	def createProfilingBox(self):
+		self.profilingBox = QGroupBox("Profiling")
+
+		profileBox = QCheckBox("Record Timings")
+		profileBox.setChecked(False)
+		profileBox.toggled.connect(self.setProfiling)
+
+		exportButton = QPushButton("Export CSV")
+		exportButton.clicked.connect(self.exportProfile)
+
+		self.profilingLabel = QLabel("Timings off")
+
+		layout = QVBoxLayout()
+		layout.addWidget(profileBox)
+		layout.addWidget(self.profilingLabel)
+		layout.addWidget(exportButton)
+		self.profilingBox.setLayout(layout)
+
+	def setProfiling(self, enabled):
+		self.sceneState.engine.profiler.enable(enabled)
+		if not enabled:
+			self.profilingLabel.setText("Timings off")
+
+	def updateProfilingPanel(self):
+		profiler = self.sceneState.engine.profiler
+		if not profiler.enabled:
+			return
+		recent = profiler.recent()
+		if recent is None:
+			return
+		# mean over the last steps, milliseconds per phase then the counters
+		lines = ["{0}: {1:.2f} ms".format(name, 1000 * recent[name]) for name in PHASES]
+		lines += ["{0}: {1:.0f}".format(name, recent[name]) for name in COUNTERS]
+		self.profilingLabel.setText("\n".join(lines))
+
+	def exportProfile(self):
+		path, _ = QFileDialog.getSaveFileName(self, "Export Timings", "profile.csv", "CSV (*.csv)")
+		if path:
+			self.sceneState.engine.profiler.to_csv(path)
+
 	def add_cells(self, num):
 		self.foregroundBrush.setColor(self.cellColor)
 		self.foregroundBrush.setStyle(Qt.SolidPattern)
 
-		for _ in range(num):
-			cpx, cpy = np.random.randint(0, 256, 2)
-			
-			cell = self.sceneState.addCell(cpx, cpy)
-			self.graphicsScene.addItem(cell)
+		self.sceneState.seedCells(num, self.graphicsScene)
 		self.sceneState.updateCellCoords()
 
 	def createGraphicsDisplay(self):
 		self.graphicsDisplayBox = QGroupBox('Simulation')
 		self.graphicsScene = QGraphicsScene()
-		self.graphicsScene.setSceneRect(0, 0, 512, 512)
-		self.add_cells(2500)
+		size = self.sceneState.sceneSize
+		self.graphicsScene.setSceneRect(0, 0, size, size)
+		self.add_cells(INITIAL_CELLS)
 		self.graphicsScene.setBackgroundBrush(self.backgroundColor)
-		self.graphicsView = QGraphicsView(self.graphicsScene)
-		self.graphicsView.setSceneRect(0, 0, 512, 512)
+		self.graphicsView = ZoomGraphicsView(self.graphicsScene)
+		self.graphicsView.setSceneRect(0, 0, size, size)
 		layout = QVBoxLayout()
 		layout.addWidget(self.graphicsView)
 		self.graphicsDisplayBox.setLayout(layout)
@@ -356,16 +614,35 @@ class MenuController(QDialog):
 		return tri
 
 	def simulationStep(self):
+		# one model step drawn straight away, for stepping by hand with the worker paused
 		self.c += 1
-		print("running sim step {0}!\n".format(self.c))
-		self.sceneState.update_cell_info(self.graphicsScene)
-		self.graphicsScene.advance()
+		self.sceneState.step()
+		self.sceneState.publish()
+		self.sceneState.present(self.graphicsScene)
+		self.updateProfilingPanel()
+
+	def renderFrame(self):
+		self.sceneState.present(self.graphicsScene)
+		if self.sceneState.batched != self.batchBox.isChecked():
+			# present switched a large population over to the heatmap
+			self.batchBox.blockSignals(True)
+			self.batchBox.setChecked(self.sceneState.batched)
+			self.batchBox.blockSignals(False)
+		self.updateProfilingPanel()
 
 	def runSimulation(self):
-		print("Running simulation\n")
-		self.timer = QTimer(self)
-		self.timer.timeout.connect(self.simulationStep)
-		self.timer.start(1000/33)
+		if self.worker is None:
+			self.worker = SimulationWorker(self.sceneState)
+			self.worker.start()
+		self.worker.resume()
+		self.timer.start(int(1000/33))
+
+	def closeEvent(self, event):
+		if self.worker:
+			self.worker.stop()
+		if self.sceneState.engine.steps > 0:
+			self.sceneState.saveCheckpoint(AUTOSAVE)
+		super(MenuController, self).closeEvent(event)
 
 
 
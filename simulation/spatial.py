@@ -0,0 +1,149 @@
+import numpy as np
+
+# bucket offsets covering each neighbor pair exactly once, the home bucket is handled separately
+HALF_SHELL = ((1, 0), (-1, 1), (0, 1), (1, 1))
+
+# row and pair indices, a population stays far below 2**31 rows
+INDEX = np.int32
+
+def expand_ranges(first, last, owner, index, ramp):
+	# flatten the index ranges [first, last) into (owner, index) pairs, written into owner and
+	# index which hold exactly the total; ramp is 0, 1, 2, ... at least as long
+	counts = np.maximum(last - first, 0)
+	if len(owner) == 0:
+		return
+	ends = np.cumsum(counts)
+	starts = ends - counts
+	nonempty = np.flatnonzero(counts)
+	# the first pair of every range steps the owner on to it, a running sum fills the rest
+	owner[:] = 0
+	owner[starts[nonempty]] = np.diff(nonempty, prepend=0)
+	np.cumsum(owner, out=owner)
+	# clip mode takes straight into out, the default mode would buffer a copy
+	np.take((first - starts).astype(index.dtype), owner, out=index, mode="clip")
+	index += ramp[:len(index)]
+
+def grown(buf, n):
+	# buf when it holds n rows, otherwise a new one at least twice as long
+	if len(buf) >= n:
+		return buf
+	return np.empty((max(n, 2 * len(buf)),) + buf.shape[1:], dtype=buf.dtype)
+
+def periodic_images(pos, period, margin):
+	# cells within margin of an edge copied across to the other side, so a plain grid finds the
+	# pairs that wrap around; source maps every row back to the cell it copies
+	source = np.arange(len(pos))
+	for axis in (0, 1):
+		lo = np.flatnonzero(pos[:, axis] < margin)
+		hi = np.flatnonzero(pos[:, axis] >= period - margin)
+		shift = np.zeros(2)
+		shift[axis] = period
+		pos = np.concatenate((pos, pos[lo] + shift, pos[hi] - shift))
+		source = np.concatenate((source, source[lo], source[hi]))
+	return pos, source
+
+class CellGrid():
+	# uniform grid (cell list) over the cell positions, rebuilt once per step. Candidate and pair
+	# indices go into buffers kept from step to step and only grown, the pairs half_pairs returns
+	# are views of them that the next call overwrites.
+	def __init__(self, cell_size):
+		self.cell_size = float(cell_size)
+		self.order = np.zeros(0, dtype=INDEX)
+		self.starts = np.zeros(1, dtype=INDEX)
+		self.bx = np.zeros(0, dtype=INDEX)
+		self.by = np.zeros(0, dtype=INDEX)
+		self.nx = 0
+		self.ny = 0
+		self.pos = np.zeros((0, 2))
+		self.sorted = np.zeros((0, 2))
+		self.rows = np.zeros(0, dtype=INDEX)
+		self.buffers = dict((name, np.zeros(0, dtype=dtype)) for name, dtype in (
+			("rank_i", INDEX), ("rank_j", INDEX), ("pair_i", INDEX), ("pair_j", INDEX), ("ramp", INDEX),
+			("dx", float), ("dy", float), ("other", float), ("near", bool)))
+
+	def buffer(self, name, n):
+		buf = grown(self.buffers[name], n)
+		if buf is not self.buffers[name]:
+			if name == "ramp":
+				buf[:] = np.arange(len(buf))
+			self.buffers[name] = buf
+		return buf[:n]
+
+	def build(self, pos, rows=None):
+		# rows, when given, is what half_pairs reports for each position instead of its index
+		self.pos = pos
+		if len(pos) == 0:
+			self.order = np.zeros(0, dtype=INDEX)
+			self.starts = np.zeros(1, dtype=INDEX)
+			self.sorted = np.zeros((0, 2))
+			self.rows = np.zeros(0, dtype=INDEX)
+			self.nx = self.ny = 0
+			return
+		# buckets sit on multiples of the cell size, so a subset of the cells (a tile and its halo)
+		# sees the same buckets, the same pair order and so the same force sums as the whole box
+		b = pos // self.cell_size
+		b = (b - b.min(axis=0)).astype(INDEX)
+		self.nx = int(b[:, 0].max()) + 1
+		self.ny = int(b[:, 1].max()) + 1
+		key = b[:, 1] * self.nx + b[:, 0]
+		# counting sort of the cells by bucket
+		self.order = np.argsort(key, kind="stable").astype(INDEX)
+		self.starts = np.zeros(self.nx * self.ny + 1, dtype=INDEX)
+		np.cumsum(np.bincount(key, minlength=self.nx * self.ny), out=self.starts[1:])
+		self.bx = b[self.order, 0]
+		self.by = b[self.order, 1]
+		# the pair search works on bucket ranks, positions and rows are looked up in that order
+		self.sorted = pos[self.order]
+		self.rows = self.order if rows is None else np.asarray(rows, dtype=INDEX)[self.order]
+
+	def candidates(self):
+		# all pairs of cells sharing a bucket or sitting in adjacent buckets, each pair once, as
+		# bucket ranks in the rank_i/rank_j buffers; returns the pair count
+		n = len(self.order)
+		rank = np.arange(n, dtype=INDEX)
+		key = self.by * self.nx + self.bx
+		ranges = [(rank + 1, self.starts[key + 1], None)]
+		for dx, dy in HALF_SHELL:
+			x = self.bx + dx
+			y = self.by + dy
+			ok = np.flatnonzero((x >= 0) & (x < self.nx) & (y < self.ny)).astype(INDEX)
+			k = y[ok] * self.nx + x[ok]
+			ranges.append((self.starts[k], self.starts[k + 1], ok))
+		sizes = [int(np.maximum(last - first, 0).sum()) for first, last, _ in ranges]
+		total = sum(sizes)
+		qs, cs = self.buffer("rank_i", total), self.buffer("rank_j", total)
+		ramp = self.buffer("ramp", max(sizes + [0]))
+		at = 0
+		for (first, last, ok), m in zip(ranges, sizes):
+			q, c = qs[at:at + m], cs[at:at + m]
+			if ok is None:
+				expand_ranges(first, last, q, c, ramp)
+			else:
+				# shell ranges are owned by the rows in ok, pair_i is free until half_pairs fills it
+				owner = self.buffer("pair_i", m)
+				expand_ranges(first, last, owner, c, ramp)
+				np.take(ok, owner, out=q, mode="clip")
+			at += m
+		return total
+
+	def half_pairs(self, radius):
+		# every neighbor pair within radius, once, as rows (indices into pos unless build got rows)
+		m = self.candidates()
+		qs, cs = self.buffers["rank_i"][:m], self.buffers["rank_j"][:m]
+		dx, dy, other = self.buffer("dx", m), self.buffer("dy", m), self.buffer("other", m)
+		for axis, d in ((0, dx), (1, dy)):
+			np.take(self.sorted[:, axis], qs, out=d, mode="clip")
+			d -= np.take(self.sorted[:, axis], cs, out=other, mode="clip")
+		dx *= dx
+		dy *= dy
+		dx += dy
+		kept = np.flatnonzero(np.less_equal(dx, radius * radius, out=self.buffer("near", m)))
+		# the kept ranks go aside, then come back into the front of the rank buffers as rows
+		k = len(kept)
+		i, j = self.buffer("pair_i", k), self.buffer("pair_j", k)
+		np.take(qs, kept, out=i, mode="clip")
+		np.take(cs, kept, out=j, mode="clip")
+		np.take(self.rows, i, out=qs[:k], mode="clip")
+		np.take(self.rows, j, out=cs[:k], mode="clip")
+		return qs[:k], cs[:k]
+
@@ -0,0 +1,164 @@
+import json
+import os
+import numpy as np
+from engine import BOUNDS
+
+FRAME_DTYPE = np.dtype([
+	("id", np.int64),
+	("x", np.float32),
+	("y", np.float32),
+	("vx", np.float32),
+	("vy", np.float32),
+	("radius", np.int16),
+	("motile", np.bool_),
+])
+
+# one index row per recorded step: step number, chunk file, first row, row count
+INDEX_COLUMNS = ("step", "chunk", "start", "count")
+
+def chunk_path(path, chunk):
+	return os.path.join(path, "chunk_{0:05d}.npy".format(chunk))
+
+def replace_file(path, write):
+	# write(f) into a new file renamed over path; a file hard linked elsewhere (a result cache
+	# entry) is left as it was instead of being rewritten in place
+	tmp = path + ".tmp"
+	with open(tmp, "wb") as f:
+		write(f)
+	os.replace(tmp, path)
+
+def engine_frame(engine):
+	# the active cells of an engine as one structured frame
+	idx = np.flatnonzero(engine.active)
+	frame = np.empty(len(idx), dtype=FRAME_DTYPE)
+	frame["id"] = engine.ids[idx]
+	frame["x"] = engine.pos[idx, 0]
+	frame["y"] = engine.pos[idx, 1]
+	frame["vx"] = engine.vel[idx, 0]
+	frame["vy"] = engine.vel[idx, 1]
+	frame["radius"] = engine.radius[idx]
+	frame["motile"] = engine.motile[idx]
+	return frame
+
+def load_frame(engine, frame):
+	# replace an engine's cells with the contents of a recorded frame
+	engine.resize(len(frame))
+	engine.pos[:, 0] = frame["x"]
+	engine.pos[:, 1] = frame["y"]
+	engine.vel[:, 0] = frame["vx"]
+	engine.vel[:, 1] = frame["vy"]
+	engine.force[:] = 0.0
+	engine.radius[:] = frame["radius"]
+	engine.motile[:] = frame["motile"]
+	engine.switch[:] = 0.0
+	engine.active[:] = True
+	engine.ids[:] = frame["id"]
+	engine.bin[:] = -1
+
+class TrajectoryWriter():
+	# streams frames into fixed size memory-mapped chunk files, so RAM stays bounded by one chunk;
+	# with resume_step an existing recording keeps its frames up to that step and goes on in a new chunk;
+	# the box the cells were in is kept alongside so a replay draws them at the recorded scale
+	def __init__(self, path, chunk_rows=1 << 20, resume_step=None, bounds=BOUNDS, boundary="reflective"):
+		self.path = path
+		self.chunk_rows = chunk_rows
+		self.bounds = float(bounds)
+		self.boundary = boundary
+		self.index = list()
+		self.chunk = -1
+		self.used = 0
+		self.data = None
+		os.makedirs(path, exist_ok=True)
+		if resume_step is not None and os.path.exists(os.path.join(path, "index.npy")):
+			index = np.load(os.path.join(path, "index.npy"))
+			self.index = [tuple(int(v) for v in row) for row in index if row[0] <= resume_step]
+			with open(os.path.join(path, "meta.json")) as f:
+				self.chunk = json.load(f)["chunks"] - 1
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def new_chunk(self, rows):
+		if self.data is not None:
+			self.data.flush()
+		self.chunk += 1
+		self.used = 0
+		# chunks are written through the map, so always into a new file
+		path = chunk_path(self.path, self.chunk)
+		if os.path.exists(path):
+			os.remove(path)
+		self.data = np.lib.format.open_memmap(path, mode="w+",
+			dtype=FRAME_DTYPE, shape=(max(rows, self.chunk_rows),))
+		self.write_index()
+
+	def append_frame(self, step, frame):
+		n = len(frame)
+		if self.data is None or self.used + n > len(self.data):
+			self.new_chunk(n)
+		self.data[self.used:self.used + n] = frame
+		self.index.append((step, self.chunk, self.used, n))
+		self.used += n
+
+	def append(self, engine):
+		self.append_frame(engine.steps, engine_frame(engine))
+
+	def write_index(self):
+		index = np.array(self.index, dtype=np.int64).reshape(-1, 4)
+		meta = {"columns": INDEX_COLUMNS, "fields": FRAME_DTYPE.names, "chunks": self.chunk + 1,
+			"bounds": self.bounds, "boundary": self.boundary}
+		replace_file(os.path.join(self.path, "index.npy"), lambda f: np.save(f, index))
+		replace_file(os.path.join(self.path, "meta.json"), lambda f: f.write(json.dumps(meta).encode()))
+
+	def flush(self):
+		if self.data is not None:
+			self.data.flush()
+		self.write_index()
+
+	def close(self):
+		self.flush()
+		self.data = None
+
+class Trajectory():
+	# read side, chunks are memory mapped on first use and frames are views into them
+	def __init__(self, path):
+		self.path = path
+		self.index = np.load(os.path.join(path, "index.npy"))
+		with open(os.path.join(path, "meta.json")) as f:
+			meta = json.load(f)
+		# recordings from before the box was stored were made in the default one
+		self.bounds = meta.get("bounds", BOUNDS)
+		self.boundary = meta.get("boundary", "reflective")
+		self.chunks = dict()
+
+	def __len__(self):
+		return len(self.index)
+
+	def __getitem__(self, k):
+		if isinstance(k, slice):
+			return [self.frame(i) for i in range(*k.indices(len(self)))]
+		return self.frame(k)
+
+	@property
+	def steps(self):
+		return self.index[:, 0]
+
+	def chunk(self, c):
+		if c not in self.chunks:
+			self.chunks[c] = np.load(chunk_path(self.path, c), mmap_mode="r")
+		return self.chunks[c]
+
+	def frame(self, k):
+		step, c, start, count = self.index[k]
+		return self.chunk(c)[start:start + count]
+
+	def find(self, step):
+		# position of the first recorded frame at or after step
+		return int(np.searchsorted(self.steps, step))
+
+	def step_range(self, start, stop):
+		# frames recorded for steps in [start, stop)
+		for k in range(self.find(start), self.find(stop)):
+			yield self.index[k, 0], self.frame(k)
@@ -0,0 +1,49 @@
+import threading
+import time
+
+class SimulationWorker(threading.Thread):
+	# steps a SceneState's model off the GUI thread: every frame period it runs time factor
+	# fixed-dt steps and publishes one snapshot, the GUI draws the latest one at its own pace
+	def __init__(self, sceneState, period=1.0 / 33):
+		super(SimulationWorker, self).__init__(daemon=True)
+		self.sceneState = sceneState
+		self.period = period
+		self.owed = 0.0
+		self.running = threading.Event()
+		self.stopped = False
+
+	def resume(self):
+		self.running.set()
+
+	def pause(self):
+		self.running.clear()
+
+	def stop(self):
+		self.stopped = True
+		self.running.set()
+
+	def frame(self):
+		# fractional factors carry over, so 0.5x steps on every other frame
+		self.owed += self.sceneState.getTimeFactor()
+		steps = int(self.owed)
+		self.owed -= steps
+		for _ in range(steps):
+			self.sceneState.step()
+		if steps:
+			self.sceneState.publish()
+		return steps
+
+	def run(self):
+		deadline = time.perf_counter()
+		while True:
+			self.running.wait()
+			if self.stopped:
+				return
+			self.frame()
+			deadline += self.period
+			delay = deadline - time.perf_counter()
+			if delay > 0:
+				time.sleep(delay)
+			else:
+				# running behind (or just resumed), slow frames are not made up for later
+				deadline = time.perf_counter()
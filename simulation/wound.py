@@ -0,0 +1,52 @@
+import math
+import numpy as np
+
+GEOMETRIES = ("line", "poly", "circle")
+
+# side of the square scene the dialog draws the box into; wound sizes (a line's width, a shape's
+# area) are given in its units whatever the box, so a wound covers the same part of any box
+SCENE_SIZE = 512.0
+
+def polygon_vertices(area, angles, center):
+	# regular polygon with the same circumradius drawWound uses
+	r = math.sqrt(area / math.pi)
+	t = 2 * math.pi * np.arange(1, angles + 1) / angles
+	return np.stack((r * np.cos(t) + center[0], r * np.sin(t) + center[1]), axis=1)
+
+def inside_polygon(pos, verts):
+	# convex polygon test, a point is inside when it is on the same side of every edge
+	a = verts
+	b = np.roll(verts, -1, axis=0)
+	e = b - a
+	rel = pos[:, None, :] - a[None, :, :]
+	cross = e[None, :, 0] * rel[:, :, 1] - e[None, :, 1] * rel[:, :, 0]
+	return (cross >= 0).all(axis=1) | (cross <= 0).all(axis=1)
+
+def wound_mask(pos, geometry, area, angles=3, center=(128.0, 128.0), width=256.0):
+	# which cells fall inside the wound, evaluated for the whole position array at once
+	pos = np.asarray(pos, dtype=float).reshape(-1, 2)
+	cx, cy = center
+	if geometry == "line":
+		return (np.abs(pos[:, 1] - cy) <= area / 2) & (pos[:, 0] >= cx - width / 2) & (pos[:, 0] <= cx + width / 2)
+	elif geometry == "poly":
+		return inside_polygon(pos, polygon_vertices(area, angles, center))
+	elif geometry == "circle":
+		r = math.sqrt(area / math.pi)
+		d = pos - np.array(center)
+		return np.einsum('ij,ij->i', d, d) <= r * r
+	raise ValueError("unknown wound geometry {0}".format(geometry))
+
+def engine_area(geometry, area, bounds, scene=SCENE_SIZE):
+	# a wound size in scene units as engine units of a bounds box: a line's width scales with
+	# the side, the other shapes' areas with its square
+	scale = scene / bounds
+	return area / scale if geometry == "line" else area / (scale * scale)
+
+def wound_area(geometry, area, angles=3, width=256.0):
+	# actual area covered by the wound shape
+	if geometry == "line":
+		return area * width
+	elif geometry == "poly":
+		r = math.sqrt(area / math.pi)
+		return 0.5 * angles * r * r * math.sin(2 * math.pi / angles)
+	return area